@@ -0,0 +1,61 @@
+# Persistent on-disk cache for LLM responses, shared by the translate scripts
+
+import hashlib
+import json
+import sqlite3
+
+DB_PATH = "llm_cache.sqlite3"
+# Bump when the prompt/response contract changes so stale rows are ignored
+SCHEMA_VERSION = 1
+
+_conn = None
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(DB_PATH)
+        # WAL lets concurrent readers proceed while one writer appends
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "  key TEXT PRIMARY KEY,"
+            "  value TEXT NOT NULL"
+            ")"
+        )
+        _conn.commit()
+    return _conn
+
+
+def make_key(model: str, system: str, user: str) -> str:
+    """
+    Content hash of the full request. The model name and SCHEMA_VERSION
+    are part of the key, so switching models or bumping the version
+    silently invalidates old entries.
+    """
+    h = hashlib.blake2b()
+    h.update(f"v{SCHEMA_VERSION}".encode())
+    for part in (model, system, user):
+        h.update(b"\0")
+        h.update(part.encode("utf-8"))
+    return h.hexdigest()
+
+
+def get(key: str):
+    """Return the cached parsed value for key, or None on a miss."""
+    row = (
+        _connect()
+        .execute("SELECT value FROM responses WHERE key = ?", (key,))
+        .fetchone()
+    )
+    return json.loads(row[0]) if row else None
+
+
+def put(key: str, value) -> None:
+    """Store a JSON-serializable value under key."""
+    conn = _connect()
+    conn.execute(
+        "INSERT OR REPLACE INTO responses (key, value) VALUES (?, ?)",
+        (key, json.dumps(value, ensure_ascii=False)),
+    )
+    conn.commit()
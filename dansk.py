@@ -4,14 +4,17 @@ audio_map_path = "audio_map.json"
 output_apkg = "danish.apkg"
 limit = None
 
-import json
-from pathlib import Path
-from random import randrange
+import os
+from itertools import chain, islice
 import genanki
+import ijson
+import orjson
 
 
-DECK_ID = randrange(1 << 30, 1 << 31)
-MODEL_ID = randrange(1 << 30, 1 << 31)
+# Fixed IDs: random IDs made Anki treat every re-generated .apkg as a
+# brand-new deck/model, losing review history on re-import
+DECK_ID = 1739234022
+MODEL_ID = 1957283897
 
 FIELDS = [
     {"name": "Headword"},
@@ -89,19 +92,25 @@ MODEL = genanki.Model(
 )
 
 
+_BRACE_TBL = str.maketrans("", "", "{}")
+
+
 def sanitize(text: str) -> str:
     """
     Remove all braces and trim whitespace.
     """
-    return text.replace("{", "").replace("}", "").strip() if text else ""
+    return text.translate(_BRACE_TBL).strip() if text else ""
 
 
-def build_ipa_html(entry, audio_map):
+def build_ipa_html(entry, audio_map, audio_basename):
     """
     - For each pronunciation, generate a [sound:filename] tag to enable Anki replay button
     - Then display the IPA text; the replay button appears automatically after the text
+    - Returns (html, media_paths) so the caller can collect media files
+      without re-walking the pronunciations
     """
     rows = []
+    media = []
     for u in entry.get("udtale", []):
         ipa_raw = sanitize(u.get("ipa", ""))
         if not ipa_raw:
@@ -112,7 +121,11 @@ def build_ipa_html(entry, audio_map):
             f'<span class="ipa-label">({sanitize(label)})</span>' if label else ""
         )
         url = u.get("audio", "")
-        sound_tag = f"[sound:{Path(audio_map[url]).name}]" if url in audio_map else ""
+        if url in audio_map:
+            sound_tag = f"[sound:{audio_basename[url]}]"
+            media.append(audio_map[url])
+        else:
+            sound_tag = ""
         rows.append(
             f'<div class="ipa-row">'
             f'<span class="ipa-text">[{core}]</span>'
@@ -120,12 +133,12 @@ def build_ipa_html(entry, audio_map):
             f"{sound_tag}"
             f"</div>"
         )
-    return "".join(rows).rstrip("} \n")
+    return "".join(rows).rstrip("} \n"), media
 
 
-def extract_definitions(entry):
+def extract_definitions(defs):
     parts = []
-    for d in entry.get("definitions", []):
+    for d in defs:
         num = sanitize(d.get("number", ""))
         txt = sanitize(d.get("definition", ""))
         if txt:
@@ -133,8 +146,8 @@ def extract_definitions(entry):
     return "<br>".join(parts)
 
 
-def extract_first_example(entry):
-    for d in entry.get("definitions", []):
+def extract_first_example(defs):
+    for d in defs:
         for ex in d.get("examples") or []:
             txt = sanitize(ex.get("text", ""))
             if txt:
@@ -146,85 +159,104 @@ def join_safe(lst, sep="; "):
     return sep.join(lst) if lst else ""
 
 
-entries = json.load(open(json_path, encoding="utf-8"))
-audio_map = json.load(open(audio_map_path, encoding="utf-8"))
-if limit:
-    entries = entries[:limit]
-
-
-entries_by_name = {Path(e["file"]).stem.lower(): e for e in entries}
-ordered = []
-seen = set()
-for w in wordlist:
-    if w in entries_by_name:
-        ordered.append(entries_by_name[w])
-        seen.add(w)
-# append the rest in original order
-for e in entries:
-    name = Path(e["file"]).stem.lower()
-    if name not in seen:
-        ordered.append(e)
-entries = ordered
+def file_stem(e):
+    """
+    Lowercased file stem; plain string ops instead of a PurePath per entry.
+    """
+    return os.path.splitext(os.path.basename(e["file"]))[0].lower()
 
 
-deck = genanki.Deck(DECK_ID, "Danish • DDO Core Vocabulary v19")
-media_files = []
+def iter_json_entries():
+    """
+    Stream entries from the JSON file one at a time instead of
+    materializing the whole list in memory.
+    """
+    with open(json_path, "rb") as f:
+        items = ijson.items(f, "item")
+        yield from islice(items, limit) if limit else items
+
+
+def main():
+    audio_map = orjson.loads(open(audio_map_path, "rb").read())
+    # audio_map is static: basenames for the [sound:] tags can be computed once
+    audio_basename = {url: os.path.basename(p) for url, p in audio_map.items()}
+
+    # First pass: keep only the entries the wordlist ordering will consult
+    wordset = set(wordlist)
+    entries_by_name = {
+        name: e for e in iter_json_entries() if (name := file_stem(e)) in wordset
+    }
+
+    # Wordlist entries first, then (second pass) the rest in original
+    # order — chained generators, never an intermediate ordered list
+    wordlist_entries = (entries_by_name[w] for w in wordlist if w in entries_by_name)
+    rest = (e for e in iter_json_entries() if file_stem(e) not in entries_by_name)
+    entries_iter = chain(wordlist_entries, rest)
+
+    deck = genanki.Deck(DECK_ID, "Danish • DDO Core Vocabulary v19")
+    media_files = set()
+    notes = []
+
+    for entry in entries_iter:
+        hw = sanitize(entry.get("headword", ""))
+        pos_full = sanitize(entry.get("pos", ""))
+        defs = entry.get("definitions", [])
+        ipa_html, entry_media = build_ipa_html(entry, audio_map, audio_basename)
+        media_files.update(entry_media)
+
+        definition = extract_definitions(defs) or "(no definition)"
+        grammar_raw = ""
+        for d in defs:
+            g = d.get("grammar")
+            if g:
+                grammar_raw = g
+                break
+        grammar = sanitize(grammar_raw)
+        example = extract_first_example(defs)
+        variants = join_safe(entry.get("wordforms", []))
+        collocs = join_safe(
+            [fx.get("expression", "") for fx in entry.get("fixed_expressions", [])]
+        )
+        od = entry.get("orddannelser", {})
+        derivs = (
+            od.get("Afledninger", [])
+            + od.get("Sammensætninger", [])
+            + od.get("Øvrige", [])
+        )
+        derivatives = join_safe(derivs, ", ")
+        raw_ety = (entry.get("etymology") or {}).get("raw", "")
+        # truncate before sanitizing (with slack for stripped braces) so
+        # multi-KB etymology strings never get fully processed
+        etymology = sanitize(raw_ety[:160])[:120] + "…" if raw_ety else ""
+
+        note = genanki.Note(
+            model=MODEL,
+            fields=[
+                hw,
+                pos_full,
+                ipa_html,
+                definition,
+                grammar,
+                example,
+                variants,
+                collocs,
+                derivatives,
+                etymology,
+            ],
+            guid=genanki.guid_for(hw, pos_full),
+        )
+        notes.append(note)
 
-for entry in entries:
-    hw = sanitize(entry.get("headword", ""))
-    pos_full = sanitize(entry.get("pos", ""))
-    ipa_html = build_ipa_html(entry, audio_map)
+    # bulk-extend once instead of one add_note call per entry
+    deck.notes.extend(notes)
 
-    for u in entry.get("udtale", []):
-        url = u.get("audio", "")
-        if url in audio_map:
-            media_files.append(audio_map[url])
-
-    definition = extract_definitions(entry) or "(no definition)"
-    grammar = sanitize(
-        next(
-            (
-                d.get("grammar")
-                for d in entry.get("definitions", [])
-                if d.get("grammar")
-            ),
-            "",
-        )
+    pkg = genanki.Package(deck)
+    pkg.media_files = list(media_files)
+    pkg.write_to_file(output_apkg)
+    print(
+        f"✓ Generated {output_apkg}: {len(deck.notes)} cards, {len(media_files)} media files"
     )
-    example = extract_first_example(entry)
-    variants = join_safe(entry.get("wordforms", []))
-    collocs = join_safe(
-        [fx.get("expression", "") for fx in entry.get("fixed_expressions", [])]
-    )
-    od = entry.get("orddannelser", {})
-    derivs = (
-        od.get("Afledninger", []) + od.get("Sammensætninger", []) + od.get("Øvrige", [])
-    )
-    derivatives = join_safe(derivs, ", ")
-    raw_ety = (entry.get("etymology") or {}).get("raw", "")
-    etymology = sanitize(raw_ety)[:120] + "…" if raw_ety else ""
-
-    note = genanki.Note(
-        model=MODEL,
-        fields=[
-            hw,
-            pos_full,
-            ipa_html,
-            definition,
-            grammar,
-            example,
-            variants,
-            collocs,
-            derivatives,
-            etymology,
-        ],
-        guid=genanki.guid_for(hw, pos_full),
-    )
-    deck.add_note(note)
 
-pkg = genanki.Package(deck)
-pkg.media_files = media_files
-pkg.write_to_file(output_apkg)
-print(
-    f"✓ Generated {output_apkg}: {len(deck.notes)} cards, {len(media_files)} media files"
-)
+
+if __name__ == "__main__":
+    main()
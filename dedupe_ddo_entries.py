@@ -1,56 +1,58 @@
 # Remove duplicate entries by selecting the one with the highest richness score
 
-import json
-from collections import defaultdict
+import orjson
+from collections import Counter
 
 
 def richness_score(entry):
     """
     Calculate a "richness" score for an entry by summing counts of its main fields.
     """
-    score = 0
-    score += len(entry.get("definitions", []))
-    score += len(entry.get("fixed_expressions", []))
-    score += len(entry.get("wordforms", []))
-    score += len(entry.get("udtale", []))
-    # orddannelser is a dict: include counts from each category
-    for lst in entry.get("orddannelser", {}).values():
-        score += len(lst)
-    return score
-
-
-# 1. Load original data
-with open("ddo_entries.json", "r", encoding="utf-8") as f:
-    entries = json.load(f)
-
-# 2. Group entries by headword
-groups = defaultdict(list)
-for entry in entries:
-    hw = entry.get("headword")
-    groups[hw].append(entry)
-
-# 3. Compute statistics
-total_entries = len(entries)
-unique_headwords = len(groups)
+    get = entry.get
+    return (
+        len(get("definitions", []))
+        + len(get("fixed_expressions", []))
+        + len(get("wordforms", []))
+        + len(get("udtale", []))
+        # orddannelser is a dict: include counts from each category
+        + sum(len(lst) for lst in get("orddannelser", {}).values())
+    )
+
+
+# 1. Stream the original data line by line (JSON Lines), keeping only the
+#    best-scoring entry per headword (first one if tied); memory stays
+#    O(unique headwords)
+best = {}
+counts = Counter()
+total_entries = 0
+with open("ddo_entries.jsonl", "rb") as f:
+    for line in f:
+        entry = orjson.loads(line)
+        total_entries += 1
+        hw = entry.get("headword")
+        counts[hw] += 1
+        score = richness_score(entry)
+        prev = best.get(hw)
+        if prev is None or score > prev[0]:
+            best[hw] = (score, entry)
+
+# 2. Compute statistics
+unique_headwords = len(best)
 duplicates = total_entries - unique_headwords
 
 print(f"Total entries: {total_entries}")
 print(f"Unique headwords: {unique_headwords}")
 print(f"Duplicate entries: {duplicates}\n")
 print("Duplicate headwords and their counts:")
-for hw, lst in groups.items():
-    if len(lst) > 1:
-        print(f"  {hw}: {len(lst)}")
-
-# 4. Build deduplicated list: choose the entry with the highest richness score from each group
-unique_entries = []
-for hw, lst in groups.items():
-    # Select the entry with the max richness_score (first one if tied)
-    best = max(lst, key=richness_score)
-    unique_entries.append(best)
-
-# 5. Write the deduplicated output file
-with open("ddo_entries_unique.json", "w", encoding="utf-8") as f:
-    json.dump(unique_entries, f, ensure_ascii=False, indent=2)
+for hw, n in counts.items():
+    if n > 1:
+        print(f"  {hw}: {n}")
+
+# 3. Build deduplicated list: one winner per headword, in first-seen order
+unique_entries = [t[1] for t in best.values()]
+
+# 4. Write the deduplicated output file
+with open("ddo_entries_unique.json", "wb") as f:
+    f.write(orjson.dumps(unique_entries, option=orjson.OPT_INDENT_2))
 
 print("\n✔ Deduplication complete. File saved as 'ddo_entries_unique.json'.")
@@ -3,9 +3,12 @@
 
 
 import os
-import json
 import re
+import shutil
+import orjson
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlparse
 
 # Configuration
@@ -13,6 +16,10 @@ INPUT_JSON = "ddo_entries_unique.json"
 OUTPUT_DIR = "audio"
 MAP_JSON = "audio_map.json"
 HEADERS = {"User-Agent": "python-requests/2.x"}
+MAX_WORKERS = 16
+SAVE_EVERY = 50  # flush the mapping to disk after this many new downloads
+
+_CD_RE = re.compile(r'filename\*?=(?:UTF-8\'\')?"?([^";]+)"?')
 
 
 def ensure_dir(path):
@@ -28,7 +35,7 @@ def derive_filename(resp, url):
     """
     cd = resp.headers.get("content-disposition", "")
     if cd:
-        m = re.search(r'filename\*?=(?:UTF-8\'\')?"?([^";]+)"?', cd)
+        m = _CD_RE.search(cd)
         if m:
             raw = m.group(1)
         else:
@@ -39,21 +46,77 @@ def derive_filename(resp, url):
     return raw.replace(" ", ".")
 
 
+def save_map(audio_map):
+    """
+    Write the mapping compactly (machine-read only, no indent) and
+    atomically: tmp file + rename, so an interrupted run can't truncate it.
+    """
+    tmp = MAP_JSON + ".tmp"
+    with open(tmp, "wb") as mf:
+        mf.write(orjson.dumps(audio_map, option=orjson.OPT_APPEND_NEWLINE))
+    os.replace(tmp, MAP_JSON)
+
+
+def download_one(session, audio_url):
+    """
+    Download a single audio URL and return its local path, or None on failure.
+    """
+    # If the basename derived from the URL is already on disk, register it
+    # without any network I/O; DDO audio filenames are stable, so a re-run
+    # becomes a pure filesystem scan.
+    candidate = os.path.basename(urlparse(audio_url).path).replace(" ", ".")
+    if candidate:
+        local_path = os.path.join(OUTPUT_DIR, candidate)
+        if os.path.exists(local_path):
+            print(f"File exists locally, skipping download: {local_path}")
+            return local_path
+
+    try:
+        # Perform GET request with streaming to access headers
+        resp = session.get(audio_url, stream=True, timeout=10)
+        resp.raise_for_status()
+
+        # Determine local filename
+        fname = derive_filename(resp, audio_url)
+        local_path = os.path.join(OUTPUT_DIR, fname)
+
+        # If file already exists locally, update map and skip download
+        if os.path.exists(local_path):
+            print(f"File exists locally, skipping download: {local_path}")
+            resp.close()
+            return local_path
+
+        # Copy the body in a C-level loop instead of a Python chunk loop
+        resp.raw.decode_content = True
+        with open(local_path, "wb") as wf:
+            shutil.copyfileobj(resp.raw, wf, length=1024 * 64)
+        resp.close()
+
+        print(f"Downloaded: {audio_url} → {local_path}")
+        return local_path
+
+    except Exception as e:
+        print(f"Failed to download {audio_url}: {e}")
+        return None
+
+
 def main():
     # 1. Load existing mapping to preserve previously downloaded files
     if os.path.exists(MAP_JSON):
-        with open(MAP_JSON, "r", encoding="utf-8") as mf:
-            audio_map = json.load(mf)
+        with open(MAP_JSON, "rb") as mf:
+            audio_map = orjson.loads(mf.read())
     else:
         audio_map = {}
 
     # 2. Read the input entries
-    with open(INPUT_JSON, "r", encoding="utf-8") as f:
-        entries = json.load(f)
+    with open(INPUT_JSON, "rb") as f:
+        entries = orjson.loads(f.read())
 
     ensure_dir(OUTPUT_DIR)
 
-    # 3. Iterate over entries and download each audio URL
+    # 3. Collect audio URLs not yet downloaded
+    pending = []
+    seen = set()
     for entry in entries:
         for ud in entry.get("udtale", []):
             audio_url = ud.get("audio")
@@ -65,37 +128,32 @@ def main():
                 print(f"Already downloaded, skipping: {audio_url}")
                 continue
 
-            try:
-                # Perform GET request with streaming to access headers
-                resp = requests.get(audio_url, headers=HEADERS, stream=True, timeout=10)
-                resp.raise_for_status()
-
-                # Determine local filename
-                fname = derive_filename(resp, audio_url)
-                local_path = os.path.join(OUTPUT_DIR, fname)
-
-                # If file already exists locally, update map and skip download
-                if os.path.exists(local_path):
-                    print(f"File exists locally, skipping download: {local_path}")
-                    audio_map[audio_url] = local_path
-                    resp.close()
-                    continue
-
-                # Write content to file in chunks
-                with open(local_path, "wb") as wf:
-                    for chunk in resp.iter_content(1024 * 8):
-                        wf.write(chunk)
-                resp.close()
-
-                print(f"Downloaded: {audio_url} → {local_path}")
-                audio_map[audio_url] = local_path
-
-            except Exception as e:
-                print(f"Failed to download {audio_url}: {e}")
-
-    # 4. Save or update the mapping JSON
-    with open(MAP_JSON, "w", encoding="utf-8") as mf:
-        json.dump(audio_map, mf, ensure_ascii=False, indent=2)
+            if audio_url not in seen:
+                seen.add(audio_url)
+                pending.append(audio_url)
+
+    # 4. Download concurrently over one keep-alive session;
+    #    audio_map is only updated in the main thread
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    completed = 0
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {pool.submit(download_one, session, url): url for url in pending}
+        for fut in as_completed(futures):
+            local_path = fut.result()
+            if local_path:
+                audio_map[futures[fut]] = local_path
+                completed += 1
+                # Flush periodically so an interrupted run keeps its progress
+                if completed % SAVE_EVERY == 0:
+                    save_map(audio_map)
+
+    # 5. Save or update the mapping JSON
+    save_map(audio_map)
     print(f"\nSaved mapping to {MAP_JSON}")
 
 
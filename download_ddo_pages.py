@@ -4,11 +4,18 @@
 
 
 import os
+import threading
 import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from urllib.parse import quote
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 
+MAX_WORKERS = 4
+REQUESTS_PER_SECOND = 4.0  # global politeness cap across all workers
+
 
 def fetch_danish_wordlist(url):
     """
@@ -21,8 +28,8 @@ def fetch_danish_wordlist(url):
         print(f"Failed to fetch page: HTTP {response.status_code}")
         return []
 
-    # Parse the HTML with BeautifulSoup
-    soup = BeautifulSoup(response.text, "html.parser")
+    # Parse the HTML with BeautifulSoup (lxml: C parser, ~10x faster)
+    soup = BeautifulSoup(response.content, "lxml")
 
     # Find the <h3> tag marking the Danish section (id="Danish")
     danish_heading = soup.find("h3", id="Danish")
@@ -36,24 +43,42 @@ def fetch_danish_wordlist(url):
         print("No word list found in the Danish section.")
         return []
 
+    # First anchor per <li> only: some entries carry extra links
+    # (annotations, references) that are not words
     words = []
-    # Iterate through each <li> and extract the text of the <a> tag (the word)
-    for li in word_list_tag.find_all("li"):
-        a_tag = li.find("a")
-        if a_tag:
-            word = a_tag.get_text(strip=True)
-            words.append(word)
-
+    for li in word_list_tag.select("li"):
+        a = li.select_one("a")
+        if a:
+            words.append(a.get_text(strip=True))
     return words
 
 
 # Download function
 
+_rate_lock = threading.Lock()
+_errlog_lock = threading.Lock()
+_next_request_at = 0.0
+
+
+def acquire_slot():
+    """
+    Space requests globally so all workers together stay below
+    REQUESTS_PER_SECOND.
+    """
+    global _next_request_at
+    with _rate_lock:
+        now = time.monotonic()
+        wait = _next_request_at - now
+        _next_request_at = max(now, _next_request_at) + 1.0 / REQUESTS_PER_SECOND
+    if wait > 0:
+        time.sleep(wait)
+
 
 def download_ddo_page(word):
     url = base_url + quote(word)
+    acquire_slot()
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = session.get(url, timeout=10)
         response.raise_for_status()
         filepath = os.path.join(output_dir, f"{word}.html")
         with open(filepath, "w", encoding="utf-8") as f:
@@ -61,8 +86,9 @@ def download_ddo_page(word):
         print(f"[✓] Saved: {word}")
     except Exception as e:
         print(f"[✗] Failed: {word} → {e}")
-        with open("download_errors2.log", "a", encoding="utf-8") as errlog:
-            errlog.write(f"{word}\t{e}\n")
+        with _errlog_lock:
+            with open("download_errors2.log", "a", encoding="utf-8") as errlog:
+                errlog.write(f"{word}\t{e}\n")
 
 
 if __name__ == "__main__":
@@ -77,13 +103,12 @@ if __name__ == "__main__":
     output_dir = "ddo_html"
     os.makedirs(output_dir, exist_ok=True)
 
-    # Get existing HTML files in the directory (assumes filenames as <word>.html)
-    existing_files = os.listdir(output_dir)
-    existing_words = set()
-    for file in existing_files:
-        if file.endswith(".html"):
-            # Remove .html extension to get the word
-            existing_words.add(file[:-5])
+    # Get existing HTML files in the directory (assumes filenames as <word>.html);
+    # scandir streams the directory and the .html suffix strip gives the word
+    with os.scandir(output_dir) as it:
+        existing_words = {
+            e.name[:-5] for e in it if e.name.endswith(".html") and e.is_file()
+        }
 
     print(f"Found {len(existing_words)} existing word files.")
     # Filter out words already downloaded
@@ -102,9 +127,14 @@ if __name__ == "__main__":
         )
     }
 
+    # Shared session: connection pooling + automatic retries on server errors
+    session = requests.Session()
+    session.headers.update(headers)
+    retry = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+    session.mount("https://", HTTPAdapter(pool_maxsize=8, max_retries=retry))
+
     # Main loop: only download words not yet downloaded
-    for word in pending_words:
-        download_ddo_page(word)
-        time.sleep(1)  # Recommend not less than 1 second delay
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        list(pool.map(download_ddo_page, pending_words))
 
     print("[✓] All words have been downloaded!")
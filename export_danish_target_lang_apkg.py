@@ -1,5 +1,12 @@
+import gc
 import json
+import multiprocessing
+import sys
+import time
 import zlib
+import orjson
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from random import randrange
 import genanki
@@ -77,6 +84,8 @@ if TARGET_LANG.lower() == "chinese":
 WIKTIONARY_URL = (
     "https://en.wiktionary.org/wiki/Wiktionary:Frequency_lists/Danish_wordlist"
 )
+WORDLIST_CACHE = Path("wordlist_cache.json")
+CACHE_TTL_SECONDS = 7 * 86400  # the frequency list changes rarely
 
 
 # --- Anki Model Configuration ---
@@ -155,19 +164,29 @@ MODEL = genanki.Model(
 )
 
 
-def fetch_danish_wordlist(url):
+def fetch_danish_wordlist(url, refresh=False):
     """
     Request the specified Wiktionary page and parse the list of Danish words (in page order).
     Returns a list in the format [word1, word2, ...].
+    The parsed list is cached on disk for CACHE_TTL_SECONDS so re-runs skip
+    the network round-trip (and work offline); pass refresh=True
+    (--refresh-wordlist on the command line) to force a new fetch.
     """
+    if (
+        not refresh
+        and WORDLIST_CACHE.exists()
+        and time.time() - WORDLIST_CACHE.stat().st_mtime < CACHE_TTL_SECONDS
+    ):
+        return json.loads(WORDLIST_CACHE.read_text(encoding="utf-8"))
+
     # Get the webpage content
     response = requests.get(url)
     if response.status_code != 200:
         print(f"Failed to fetch page: HTTP {response.status_code}")
         return []
 
-    # Parse the HTML with BeautifulSoup
-    soup = BeautifulSoup(response.text, "html.parser")
+    # Parse the HTML with BeautifulSoup (lxml: C parser, ~10x faster)
+    soup = BeautifulSoup(response.content, "lxml")
 
     # Find the <h3> tag marking the Danish section (id="Danish")
     danish_heading = soup.find("h3", id="Danish")
@@ -189,24 +208,37 @@ def fetch_danish_wordlist(url):
             word = a_tag.get_text(strip=True)
             words.append(word)
 
+    if words:
+        WORDLIST_CACHE.write_text(
+            json.dumps(words, ensure_ascii=False), encoding="utf-8"
+        )
+
     return words
 
 
+_BRACE_TBL = str.maketrans("", "", "{}")
+
+
 def sanitize(text: str) -> str:
     """
     Remove braces and trim whitespace; convert non-string types to string.
     """
     if not isinstance(text, str):
-        if ENABLE_DEBUG_PRINTING:
+        if __debug__ and ENABLE_DEBUG_PRINTING:
             print(
                 f"[DEBUG SANITIZE WARNING] sanitize received non-string type: {type(text)}. Value: {text}"
             )
         text = str(text)
-    return text.replace("{", "").replace("}", "").strip()
-
+    # single C-level pass, no intermediate string per replace
+    return text.translate(_BRACE_TBL).strip()
 
-def build_ipa_html(entry, audio_map):
 
+def build_ipa_html(entry, audio_map, media_files_out):
+    """
+    Build the IPA/audio HTML for an entry, adding any referenced audio
+    paths to media_files_out so the caller does not re-walk the
+    pronunciations a second time.
+    """
     rows = []
     for u in entry.get("udtale", []):
         ipa_raw = sanitize(u.get("ipa", ""))
@@ -218,7 +250,11 @@ def build_ipa_html(entry, audio_map):
             f'<span class="ipa-label">({sanitize(label)})</span>' if label else ""
         )
         url = u.get("audio", "")
-        sound_tag = f"[sound:{Path(audio_map[url]).name}]" if url in audio_map else ""
+        if url in audio_map:
+            sound_tag = f"[sound:{Path(audio_map[url]).name}]"
+            media_files_out.add(audio_map[url])
+        else:
+            sound_tag = ""
         rows.append(
             f'<div class="ipa-row">'
             f'<span class="ipa-text">[{core}]</span>'
@@ -226,15 +262,44 @@ def build_ipa_html(entry, audio_map):
             f"{sound_tag}"
             f"</div>"
         )
+    # most entries have exactly one pronunciation row
+    if len(rows) == 1:
+        return rows[0].rstrip("} \n")
     return "".join(rows).rstrip("} \n")
 
 
-def extract_definitions_with_translation(entry, headword_key, definition_translations):
+_MISS = object()
 
+
+def normalize_lemma_gloss(records, kind, headword):
+    """
+    Coerce lemma/gloss values to str in place. Run once per headword at
+    load time so the per-note extractors can use the values directly
+    instead of type-checking them on every lookup.
+    """
+    for key, data in records.items():
+        if not isinstance(data, dict):
+            continue
+        for field in ("lemma", "gloss"):
+            val = data.get(field, "")
+            if not isinstance(val, str):
+                if ENABLE_DEBUG_PRINTING:
+                    print(
+                        f"[DEBUG TYPE WARNING - {kind}] {field.capitalize()} type mismatch. Headword: '{headword}', Key: '{key}'."
+                    )
+                data[field] = str(val)
+
+
+def extract_definitions_with_translation(entry, headword_key, entry_translations):
+    """
+    entry_translations is this headword's translation mapping, already
+    resolved by the caller (_MISS when the headword is unknown).
+    """
+    _san = sanitize  # local alias: avoids a global lookup per call
     parts = []
-    entry_translations = definition_translations.get(headword_key)
+    known_headword = entry_translations is not _MISS
 
-    if entry_translations is None:
+    if not known_headword:
         if ENABLE_DEBUG_PRINTING and headword_key:
             print(
                 f"[DEBUG DEF] Headword key not found in definition translations: '{headword_key}'"
@@ -242,36 +307,32 @@ def extract_definitions_with_translation(entry, headword_key, definition_transla
         entry_translations = {}
 
     for d in entry.get("definitions", []):
-        num = sanitize(d.get("number", ""))
-        txt = sanitize(d.get("definition", ""))
+        num = _san(d.get("number", ""))
+        txt = _san(d.get("definition", ""))
         if txt:
             formatted_definition = (num + " " + txt).strip()
             translation_data = entry_translations.get(txt)
 
             if translation_data:
-                lemma_raw = translation_data.get("lemma", "")
-                gloss_raw = translation_data.get("gloss", "")
-                lemma = str(lemma_raw) if not isinstance(lemma_raw, str) else lemma_raw
-                gloss = str(gloss_raw) if not isinstance(gloss_raw, str) else gloss_raw
-                if lemma is not lemma_raw and ENABLE_DEBUG_PRINTING:
-                    print(
-                        f"[DEBUG TYPE WARNING - DEF] Lemma type mismatch. Headword: '{headword_key}', Def: '{txt}'."
-                    )
-                if gloss is not gloss_raw and ENABLE_DEBUG_PRINTING:
-                    print(
-                        f"[DEBUG TYPE WARNING - DEF] Gloss type mismatch. Headword: '{headword_key}', Def: '{txt}'."
-                    )
-
-                translation_html = f'<div class="translation">{sanitize(lemma)} ({sanitize(gloss)})</div>'
+                # values were normalized to str at load time
+                lemma = translation_data.get("lemma", "")
+                gloss = translation_data.get("gloss", "")
+                translation_html = (
+                    f'<div class="translation">{_san(lemma)} ({_san(gloss)})</div>'
+                )
                 formatted_definition += translation_html
-            elif ENABLE_DEBUG_PRINTING and headword_key in definition_translations:
+            elif ENABLE_DEBUG_PRINTING and known_headword:
                 print(
                     f"[DEBUG DEF] Definition text not found for headword '{headword_key}': '{txt}'"
                 )
 
             parts.append(formatted_definition)
 
-    return "<br>".join(parts) if parts else "(no definition)"
+    if not parts:
+        return "(no definition)"
+    if len(parts) == 1:  # single-sense entries dominate; skip the join
+        return parts[0]
+    return "<br>".join(parts)
 
 
 def extract_first_example(entry):
@@ -283,95 +344,209 @@ def extract_first_example(entry):
     return ""
 
 
-def extract_collocations_with_translation(entry, headword_key, expr_translations):
+def extract_collocations_with_translation(entry, headword_key, entry_expr_data):
+    """
+    entry_expr_data is this headword's expression-translation record,
+    already resolved by the caller (None when the headword is unknown).
+    """
+    _san = sanitize  # local alias: avoids a global lookup per call
     collocation_parts = []
-    entry_expr_data = expr_translations.get(headword_key)
     entry_expr_translations = {}
 
-    if entry_expr_data and isinstance(entry_expr_data.get("fixed_expressions"), dict):
+    # remember the outcome once instead of re-probing expr_translations
+    # for every expression below
+    has_expr_map = bool(entry_expr_data) and isinstance(
+        entry_expr_data.get("fixed_expressions"), dict
+    )
+    if has_expr_map:
         entry_expr_translations = entry_expr_data["fixed_expressions"]
 
     for fx in entry.get("fixed_expressions", []):
         expression_text = fx.get("expression", "")
         if expression_text:
-            sanitized_expr = sanitize(expression_text)
+            sanitized_expr = _san(expression_text)
             formatted_collocation = sanitized_expr
             translation_data = entry_expr_translations.get(expression_text)
 
             if translation_data:
-                lemma_raw = translation_data.get("lemma", "")
-                gloss_raw = translation_data.get("gloss", "")
-                lemma = str(lemma_raw) if not isinstance(lemma_raw, str) else lemma_raw
-                gloss = str(gloss_raw) if not isinstance(gloss_raw, str) else gloss_raw
-                if lemma is not lemma_raw and ENABLE_DEBUG_PRINTING:
-                    print(
-                        f"[DEBUG TYPE WARNING - EXPR] Lemma type mismatch. Headword: '{headword_key}', Expr: '{expression_text}'."
-                    )
-                if gloss is not gloss_raw and ENABLE_DEBUG_PRINTING:
-                    print(
-                        f"[DEBUG TYPE WARNING - EXPR] Gloss type mismatch. Headword: '{headword_key}', Expr: '{expression_text}'."
-                    )
-
-                translation_html = f'<div class="translation" style="margin-left: 10px;">{sanitize(lemma)} ({sanitize(gloss)})</div>'
+                # values were normalized to str at load time
+                lemma = translation_data.get("lemma", "")
+                gloss = translation_data.get("gloss", "")
+                translation_html = f'<div class="translation" style="margin-left: 10px;">{_san(lemma)} ({_san(gloss)})</div>'
                 formatted_collocation += translation_html
-            elif (
-                ENABLE_DEBUG_PRINTING
-                and headword_key in expr_translations
-                and isinstance(
-                    expr_translations.get(headword_key, {}).get("fixed_expressions"),
-                    dict,
-                )
-            ):
+            elif ENABLE_DEBUG_PRINTING and has_expr_map:
                 print(
                     f"[DEBUG EXPR] Fixed expression text not found for headword '{headword_key}': '{expression_text}'"
                 )
 
             collocation_parts.append(formatted_collocation)
 
+    if len(collocation_parts) == 1:
+        return collocation_parts[0]
     return "<br>".join(collocation_parts)
 
 
 def join_safe(lst, sep="; "):
-    return sep.join(filter(None, map(sanitize, lst))) if lst else ""
+    if not lst:
+        return ""
+    if len(lst) == 1:
+        return sanitize(lst[0])
+    return sep.join(filter(None, map(sanitize, lst)))
+
+
+def build_note_fields(indexed_entry):
+    """
+    Pool worker: turn one entry into its note field values, guid and
+    referenced media paths. The loaded data dicts (audio_map,
+    definition_translations, expr_translations, pos_translations) are
+    read as module globals inherited through fork, so nothing large is
+    pickled per task.
+    """
+    i, entry = indexed_entry
+    media = set()
+
+    hw_raw = entry.get("headword", "")
+    hw = sanitize(hw_raw)
+    headword_key = sys.intern(hw_raw.strip())
+
+    freq_rank = entry.get("frequency_rank")
+
+    freq_rank_str = f"{freq_rank:05d}" if freq_rank is not None else ""
+
+    if not headword_key and ENABLE_DEBUG_PRINTING:
+        print(f"[DEBUG MAIN] Entry {i} has empty headword key.")
+
+    pos_original = sys.intern(sanitize(entry.get("pos", "")))
+    pos_zh = pos_translations.get(pos_original)
+    pos_full = (
+        f"{pos_original} ({sanitize(pos_zh)})"
+        if pos_original and pos_zh
+        else pos_original
+    )
+
+    ipa_html = build_ipa_html(entry, audio_map, media)
+
+    if headword_key:
+        # resolve the per-headword sub-dicts once here; the extractors
+        # then work directly on the resolved mappings
+        definition = extract_definitions_with_translation(
+            entry, headword_key, definition_translations.get(headword_key, _MISS)
+        )
+        collocs = extract_collocations_with_translation(
+            entry, headword_key, expr_translations.get(headword_key)
+        )
+    else:
+
+        definition = extract_definitions_with_translation(entry, "", _MISS)
+        collocs = extract_collocations_with_translation(entry, "", None)
+        definition = definition if definition != "(no definition)" else ""
+
+    grammar = sanitize(
+        next(
+            (
+                d.get("grammar")
+                for d in entry.get("definitions", [])
+                if d.get("grammar")
+            ),
+            "",
+        )
+    )
+    example = extract_first_example(entry)
+    variants = join_safe(entry.get("wordforms", []))
+    od = entry.get("orddannelser", {})
+    derivs = (
+        od.get("Afledninger", [])
+        + od.get("Sammensætninger", [])
+        + od.get("Øvrige", [])
+    )
+    derivatives = join_safe(derivs, ", ")
+    raw_ety = (entry.get("etymology") or {}).get("raw", "")
+    etymology = (
+        sanitize(raw_ety)[:120] + "…"
+        if raw_ety and len(raw_ety) > 120
+        else sanitize(raw_ety)
+    )
+
+    guid_for_note = genanki.guid_for(hw, f"{pos_original}-{TARGET_LANG.lower()}")
+
+    fields = [
+        hw,
+        pos_full,
+        ipa_html,
+        definition,
+        grammar,
+        example,
+        variants,
+        collocs,
+        derivatives,
+        etymology,
+        freq_rank_str,
+    ]
+    return fields, guid_for_note, media
 
 
 # --- Script Execution ---
 if __name__ == "__main__":
 
+    # Kick off the wordlist fetch in the background so the network
+    # round-trip overlaps with parsing the local JSON files below
+    wordlist_pool = ThreadPoolExecutor(max_workers=1)
+    wordlist_future = wordlist_pool.submit(
+        fetch_danish_wordlist, WIKTIONARY_URL, "--refresh-wordlist" in sys.argv
+    )
+
     print("Loading data files...")
     try:
-        entries_raw = json.load(open(json_path, encoding="utf-8"))
-        audio_map = json.load(open(audio_map_path, encoding="utf-8"))
-        definition_translations = json.load(
-            open(definition_translation_path, encoding="utf-8")
+        # orjson parses these multi-MB files several times faster than the
+        # stdlib decoder; feed it raw bytes and let it handle the UTF-8
+        entries_raw = orjson.loads(Path(json_path).read_bytes())
+        audio_map = orjson.loads(Path(audio_map_path).read_bytes())
+        definition_translations = orjson.loads(
+            Path(definition_translation_path).read_bytes()
         )
-        expr_translations = json.load(open(expr_translation_path, encoding="utf-8"))
-        pos_translations = json.load(open(pos_translation_path, encoding="utf-8"))
+        expr_translations = orjson.loads(Path(expr_translation_path).read_bytes())
+        pos_translations = orjson.loads(Path(pos_translation_path).read_bytes())
     except FileNotFoundError as e:
         print(f"Error loading file: {e}. Please ensure all JSON files exist.")
         exit(1)
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         print(f"Error decoding JSON from file: {e}. Please check the file format.")
         exit(1)
 
+    for hw_key, records in definition_translations.items():
+        if isinstance(records, dict):
+            normalize_lemma_gloss(records, "DEF", hw_key)
+    for hw_key, data in expr_translations.items():
+        fx_records = data.get("fixed_expressions") if isinstance(data, dict) else None
+        if isinstance(fx_records, dict):
+            normalize_lemma_gloss(fx_records, "EXPR", hw_key)
+
     print(f"Loaded {len(entries_raw)} raw entries.")
     if limit:
         print(f"Applying limit: processing first {limit} entries.")
         entries_raw = entries_raw[:limit]
 
     print("Fetching and processing frequency wordlist...")
-    wordlist = fetch_danish_wordlist(WIKTIONARY_URL)
+    wordlist = wordlist_future.result()
+    wordlist_pool.shutdown()
 
     final_sorted_entries = []
     if wordlist:
 
-        word_to_rank = {word.lower(): i + 1 for i, word in enumerate(wordlist)}
+        # interned keys make the rank/translation lookups below compare by
+        # pointer instead of character-by-character
+        word_to_rank = {
+            sys.intern(word.lower()): i + 1 for i, word in enumerate(wordlist)
+        }
         print(f"Created rank map for {len(word_to_rank)} unique words.")
 
         ranked_entries_data = []
         unranked_entries = []
-        processed_files = set()
 
+        # Dedupe by file stem in a single ordered-dict pass (first entry
+        # wins, insertion order preserved); the ranking loop below then
+        # runs without any membership checks
+        unique_by_file = {}
         for entry in entries_raw:
             if "file" not in entry:
                 if ENABLE_DEBUG_PRINTING:
@@ -383,7 +558,7 @@ if __name__ == "__main__":
                 continue
 
             try:
-                file_key = Path(entry["file"]).stem.lower()
+                file_key = sys.intern(Path(entry["file"]).stem.lower())
             except Exception as e:
                 if ENABLE_DEBUG_PRINTING:
                     hw_for_debug = sanitize(entry.get("headword", "N/A"))
@@ -393,10 +568,9 @@ if __name__ == "__main__":
                 unranked_entries.append(entry)
                 continue
 
-            if file_key in processed_files:
-                continue
-            processed_files.add(file_key)
+            unique_by_file.setdefault(file_key, entry)
 
+        for file_key, entry in unique_by_file.items():
             rank = word_to_rank.get(file_key)
             if rank is not None:
 
@@ -406,9 +580,15 @@ if __name__ == "__main__":
                 entry["frequency_rank"] = None
                 unranked_entries.append(entry)
 
-        ranked_entries_data.sort(key=lambda x: x[0])
-
-        sorted_ranked_entries = [item[1] for item in ranked_entries_data]
+        # Order by rank with a stable numpy argsort over a primitive int
+        # array: no key-function call or tuple comparison per element
+        ranks = np.fromiter(
+            (item[0] for item in ranked_entries_data),
+            dtype=np.int64,
+            count=len(ranked_entries_data),
+        )
+        order = np.argsort(ranks, kind="stable")
+        sorted_ranked_entries = [ranked_entries_data[i][1] for i in order]
 
         final_sorted_entries = sorted_ranked_entries + unranked_entries
         print(
@@ -427,103 +607,38 @@ if __name__ == "__main__":
     deck = genanki.Deck(DECK_ID, deck_name, description=deck_description)
 
     media_files = set()
+    notes = []
 
     print(f"Generating Anki notes for {len(final_sorted_entries)} entries...")
 
-    for i, entry in enumerate(final_sorted_entries):
-
-        hw_raw = entry.get("headword", "")
-        hw = sanitize(hw_raw)
-        headword_key = hw_raw.strip()
-
-        freq_rank = entry.get("frequency_rank")
-
-        freq_rank_str = f"{freq_rank:05d}" if freq_rank is not None else ""
-
-        if not headword_key and ENABLE_DEBUG_PRINTING:
-            print(f"[DEBUG MAIN] Entry {i} has empty headword key.")
-
-        pos_original = sanitize(entry.get("pos", ""))
-        pos_zh = pos_translations.get(pos_original)
-        pos_full = (
-            f"{pos_original} ({sanitize(pos_zh)})"
-            if pos_original and pos_zh
-            else pos_original
-        )
-
-        ipa_html = build_ipa_html(entry, audio_map)
-
-        for u in entry.get("udtale", []):
-            url = u.get("audio", "")
-            if url in audio_map:
-                media_files.add(audio_map[url])
-
-        definition = ""
-        collocs = ""
-        if headword_key:
-            definition = extract_definitions_with_translation(
-                entry, headword_key, definition_translations
-            )
-            collocs = extract_collocations_with_translation(
-                entry, headword_key, expr_translations
-            )
-        else:
-
-            definition = extract_definitions_with_translation(entry, "", {})
-            collocs = extract_collocations_with_translation(entry, "", {})
-            definition = definition if definition != "(no definition)" else ""
-
-        grammar = sanitize(
-            next(
-                (
-                    d.get("grammar")
-                    for d in entry.get("definitions", [])
-                    if d.get("grammar")
-                ),
-                "",
+    # Field building is pure CPU work (sanitizing, HTML assembly, dict
+    # lookups), so fan it out across all cores; only the cheap Note
+    # construction stays in the main process. The fork context shares the
+    # loaded data dicts with the workers through copy-on-write memory.
+    # The loop only allocates, never drops reference cycles, so pause the
+    # cyclic collector: its periodic scans over the ever-growing note list
+    # are pure overhead here.
+    gc.disable()
+    try:
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool() as note_pool:
+            results = note_pool.imap(
+                build_note_fields, enumerate(final_sorted_entries), chunksize=256
             )
-        )
-        example = extract_first_example(entry)
-        variants = join_safe(entry.get("wordforms", []))
-        od = entry.get("orddannelser", {})
-        derivs = (
-            od.get("Afledninger", [])
-            + od.get("Sammensætninger", [])
-            + od.get("Øvrige", [])
-        )
-        derivatives = join_safe(derivs, ", ")
-        raw_ety = (entry.get("etymology") or {}).get("raw", "")
-        etymology = (
-            sanitize(raw_ety)[:120] + "…"
-            if raw_ety and len(raw_ety) > 120
-            else sanitize(raw_ety)
-        )
-
-        guid_for_note = genanki.guid_for(
-            sanitize(entry.get("headword", "")), f"{pos_original}-{TARGET_LANG.lower()}"
-        )
+            for i, (fields, guid_for_note, media) in enumerate(results):
+                media_files.update(media)
+                notes.append(
+                    genanki.Note(model=MODEL, fields=fields, guid=guid_for_note)
+                )
 
-        note = genanki.Note(
-            model=MODEL,
-            fields=[
-                hw,
-                pos_full,
-                ipa_html,
-                definition,
-                grammar,
-                example,
-                variants,
-                collocs,
-                derivatives,
-                etymology,
-                freq_rank_str,
-            ],
-            guid=guid_for_note,
-        )
-        deck.add_note(note)
+                if (i + 1) % 500 == 0:
+                    print(f"Processed {i + 1}/{len(final_sorted_entries)} entries...")
+    finally:
+        gc.enable()
+        gc.collect()
 
-        if (i + 1) % 500 == 0:
-            print(f"Processed {i + 1}/{len(final_sorted_entries)} entries...")
+    # bulk-extend once instead of one add_note call per entry
+    deck.notes.extend(notes)
 
     print("Packaging Anki deck...")
     pkg = genanki.Package(deck)
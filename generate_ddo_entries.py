@@ -1,19 +1,30 @@
 # Generate ddo_entries.json from downloaded HTML files
+import functools
+import multiprocessing
 import os
-import json
+import orjson
 import re
-from bs4 import BeautifulSoup, Tag
+from selectolax.lexbor import LexborHTMLParser
 
 SUFFIX_RE = re.compile(r"^-[A-Za-zæøåÆØÅ]{1,6}$")
-UNWANTED_TEXTS = {
-    "...vis mere",
-    "...vis mindre",
-    "Læs mere om Den Danske Begrebsordbog",
-}
+UNWANTED_TEXTS = frozenset(
+    {
+        "...vis mere",
+        "...vis mindre",
+        "Læs mere om Den Danske Begrebsordbog",
+    }
+)
 DIGITS_TRAIL_RE = re.compile(r"\d+$")
+UDTRYK_ID_RE = re.compile(r"^udtryk-\d+")
 
 HTML_DIR = "./ddo_html/"
-OUTPUT = "ddo_entries.json"
+OUTPUT = "ddo_entries.jsonl"
+
+
+def has_class(node, name):
+    """True if the element node carries the given CSS class."""
+    cls = node.attributes.get("class")
+    return bool(cls) and name in cls.split()
 
 
 def transform_wordforms(headword, forms):
@@ -26,37 +37,40 @@ def transform_wordforms(headword, forms):
     return out
 
 
+@functools.lru_cache(maxsize=8192)
+def _clean_link_text(txt):
+    """
+    Cleaned link text, or "" if it should be dropped. The same cross-reference
+    words recur across thousands of entries, so the regex result is memoized.
+    """
+    if txt in UNWANTED_TEXTS:
+        return ""
+    return DIGITS_TRAIL_RE.sub("", txt)
+
+
 def clean_links(a_tags):
-    out = []
-    for a in a_tags:
-        txt = a.get_text(strip=True)
-        if txt in UNWANTED_TEXTS:
-            continue
-        txt = DIGITS_TRAIL_RE.sub("", txt)
-        if txt:
-            out.append(txt)
-    return out
+    return [txt for a in a_tags if (txt := _clean_link_text(a.text(strip=True)))]
 
 
-def parse_orddannelser(soup):
-    cont = soup.select_one("#content-orddannelser")
+def parse_orddannelser(tree):
+    cont = tree.css_first("#content-orddannelser")
     if not cont:
         return {}
     result = {}
-    for box in cont.find_all("div", class_="definitionBox"):
-        cat = box.select_one("span.stempel").get_text(strip=True)
-        inline = box.select_one("span.inlineList")
+    for box in cont.css("div.definitionBox"):
+        cat = box.css_first("span.stempel").text(strip=True)
+        inline = box.css_first("span.inlineList")
         items = []
         if inline:
-            for child in inline.children:
-                if hasattr(child, "name") and child.name == "a":
-                    form = child.get_text(strip=True)
+            for child in inline.iter(include_text=True):
+                if child.tag == "a":
+                    form = child.text(strip=True)
                     # 捕获紧随的文本节点
                     tail = ""
-                    sib = child.next_sibling
-                    while sib and isinstance(sib, str):
-                        tail += sib
-                        sib = sib.next_sibling
+                    sib = child.next
+                    while sib is not None and sib.tag == "-text":
+                        tail += sib.text_content
+                        sib = sib.next
                     tail = tail.strip()
                     if tail:
                         items.append(f"{form} {tail}")
@@ -66,228 +80,242 @@ def parse_orddannelser(soup):
     return result
 
 
-def parse_udtale(soup, fn):
+def parse_udtale(tree, fn):
     """
     Retrieve pronunciation blocks in page order and associate the nearest preceding 'diskret' as label.
     Returns a list of dictionaries with ipa, audio URL, and optional label.
 
     """
-    from bs4 import Tag
-
     out = []
-    container = soup.select_one("div#id-udt")
+    container = tree.css_first("div#id-udt")
     if not container:
         print(f"Note {fn}: no pronunciation block")
         return out
 
     # The entire block of text is within <span class="tekstmedium">
-    tekstmedium = container.select_one("span.tekstmedium")
+    tekstmedium = container.css_first("span.tekstmedium")
     if not tekstmedium:
         return out
 
-    children = list(tekstmedium.children)
-    for idx, node in enumerate(children):
-        if not (isinstance(node, Tag) and "lydskrift" in node.get("class", [])):
-            continue
-
-        ipa = node.get_text(" ", strip=True)
-        a_mp3 = node.select_one('a[href$=".mp3"]')
-        audio = a_mp3["href"] if a_mp3 else None
-
-        # Search backwards for a label: find the nearest preceding 'diskret'
-        # before the current 'lydskrift' node; stop if another 'lydskrift' is encountered.
-        label = None
-        for prev in reversed(children[:idx]):
-            if not isinstance(prev, Tag):
-                continue
-            cls = prev.get("class", [])
-            if "diskret" in cls:
-                label = prev.get_text(" ", strip=True)
-                break
-            if "lydskrift" in cls:
-                break
-
-        out.append({"ipa": ipa, "audio": audio, "label": label})
+    # Single forward pass: carry the most recent 'diskret' as the pending
+    # label and clear it after each 'lydskrift' consumes it, instead of
+    # rescanning backwards from every pronunciation block
+    label = None
+    for node in tekstmedium.iter():
+        if has_class(node, "diskret"):
+            label = node.text(separator=" ", strip=True)
+        elif has_class(node, "lydskrift"):
+            ipa = node.text(separator=" ", strip=True)
+            a_mp3 = node.css_first('a[href$=".mp3"]')
+            audio = a_mp3.attributes.get("href") if a_mp3 else None
+            out.append({"ipa": ipa, "audio": audio, "label": label})
+            label = None
 
     return out
 
 
-def parse_wordforms(soup):
-    box = soup.find("span", class_="stempel", string="Bøjning")
+def parse_wordforms(stempels):
+    box = stempels.get("Bøjning")
     if not box:
         return []
-    sib = box.find_next_sibling("span")
-    text = sib.get_text(strip=True) if sib else ""
+    sib = box.next
+    while sib is not None and sib.tag != "span":
+        sib = sib.next
+    text = sib.text(strip=True) if sib is not None else ""
     return [f.strip() for f in text.split(",") if f.strip()]
 
 
-def parse_etymology(soup):
-    box = soup.find("span", class_="stempel", string="Oprindelse")
+def parse_etymology(stempels):
+    box = stempels.get("Oprindelse")
     if not box:
         return None
-    span = box.find_next_sibling("span", class_="tekstmedium")
-    if not span:
+    span = box.next
+    while span is not None and not (
+        span.tag == "span" and has_class(span, "tekstmedium")
+    ):
+        span = span.next
+    if span is None:
         return None
-    raw = span.get_text(" ", strip=True)
+    raw = span.text(separator=" ", strip=True)
     segments, desc = [], ""
-    for node in span.contents:
-        if isinstance(node, str):
-            desc += node
-        elif node.name in ("span", "a") and (
-            "ordform" in node.get("class", []) or node.name == "a"
+    for node in span.iter(include_text=True):
+        if node.tag == "-text":
+            desc += node.text_content
+        elif node.tag in ("span", "a") and (
+            has_class(node, "ordform") or node.tag == "a"
         ):
-            form = node.get_text(strip=True)
+            form = node.text(strip=True)
             segments.append({"form": form, "description": desc.strip(" ,")})
             desc = ""
-        elif "dividerDot" in node.get("class", []):
+        elif has_class(node, "dividerDot"):
             continue
         else:
-            desc += node.get_text("", strip=True)
+            desc += node.text(separator="", strip=True)
     return {"raw": raw, "segments": segments}
 
 
-def parse_definitions(soup, fn):
+def parse_definitions(tree, fn):
     out = []
-    container = soup.find(id="content-betydninger")
+    container = tree.css_first("#content-betydninger")
     if not container:
         return out
-    for num_tag in container.select("div.definitionNumber"):
-        num = num_tag.get_text(strip=True)
-        indent = num_tag.find_next_sibling()
-        while indent and not (
-            isinstance(indent, Tag) and "definitionIndent" in indent.get("class", [])
+    for num_tag in container.css("div.definitionNumber"):
+        num = num_tag.text(strip=True)
+        indent = num_tag.next
+        while indent is not None and not (
+            indent.tag == "div" and has_class(indent, "definitionIndent")
         ):
-            indent = indent.find_next_sibling()
-        if not indent:
+            indent = indent.next
+        if indent is None:
             print(f"Warning {fn}: no definitionIndent for sense {num}")
             continue
         entry = {"number": num}
-        def_box = indent.select_one(
+        def_box = indent.css_first(
             'div.definitionBox[id^="betydning-"] span.definition'
         )
-        entry["definition"] = def_box.get_text(" ", strip=True) if def_box else None
-        gramm = indent.select_one("div.definitionBox.grammatik")
+        entry["definition"] = (
+            def_box.text(separator=" ", strip=True) if def_box else None
+        )
+        gramm = indent.css_first("div.definitionBox.grammatik")
         entry["grammar"] = (
-            (gramm.select_one("span.inlineList") or gramm).get_text(" ", strip=True)
+            (gramm.css_first("span.inlineList") or gramm).text(
+                separator=" ", strip=True
+            )
             if gramm
             else None
         )
-        if sa := indent.select_one("div.definitionBox.onym"):
-            entry["see_also"] = clean_links(sa.select("a"))
-        if rel := indent.select_one("div.definitionBox.rel-begreber"):
-            entry["related"] = clean_links(rel.select("a"))
+        if sa := indent.css_first("div.definitionBox.onym"):
+            entry["see_also"] = clean_links(sa.css("a"))
+        if rel := indent.css_first("div.definitionBox.rel-begreber"):
+            entry["related"] = clean_links(rel.css("a"))
         entry["examples"] = []
-        for cite in indent.select("div.citat-box"):
-            txt = cite.select_one("span.citat").get_text(" ", strip=True)
-            src = cite.select_one("span.kilde")
+        for cite in indent.css("div.citat-box"):
+            txt = cite.css_first("span.citat").text(separator=" ", strip=True)
+            src = cite.css_first("span.kilde")
             entry["examples"].append(
                 {
                     "text": txt,
-                    "source": src.get_text(strip=True) if src else None,
+                    "source": src.text(strip=True) if src else None,
                 }
             )
         out.append(entry)
     return out
 
 
-def parse_fixed_expressions(soup):
+def parse_fixed_expressions(tree):
     out = []
-    art = soup.select_one("div.artikel")
-    sec = art.select_one("#content-faste-udtryk") if art else None
+    art = tree.css_first("div.artikel")
+    sec = art.css_first("#content-faste-udtryk") if art else None
     if not sec:
         return out
-    for ud in sec.find_all("div", id=re.compile(r"^udtryk-\d+")):
-        match = ud.select_one("span.match")
+    for ud in sec.css('div[id^="udtryk-"]'):
+        ud_id = ud.attributes.get("id") or ""
+        if not UDTRYK_ID_RE.match(ud_id):
+            continue
+        match = ud.css_first("span.match")
         if not match:
             continue
-        expr = match.get_text(strip=True)
-        ud_id = ud.get("id", "")
+        expr = match.text(strip=True)
         details = []
-        node = ud.next_sibling
-        while node:
-            if isinstance(node, Tag):
-                if node.name == "div" and node.get("id", "").startswith("udtryk-"):
+        node = ud.next
+        while node is not None:
+            if node.tag != "-text":
+                if node.tag == "div" and (node.attributes.get("id") or "").startswith(
+                    "udtryk-"
+                ):
                     break
-                if "definitionIndent" in node.get("class", []):
-                    for box in node.find_all(
-                        "div", class_="definitionBox", recursive=False
-                    ):
-                        cls = box.get("class", [])
-                        box_id = box.get("id", "")
+                if has_class(node, "definitionIndent"):
+                    for box in node.iter():
+                        if box.tag != "div" or not has_class(box, "definitionBox"):
+                            continue
+                        box_id = box.attributes.get("id") or ""
                         if ud_id and box_id.startswith(f"{ud_id}-betydning"):
                             details.append(
                                 {
                                     "type": "definition",
-                                    "text": box.get_text(" ", strip=True),
+                                    "text": box.text(separator=" ", strip=True),
                                 }
                             )
-                        elif "onym" in cls:
-                            items = clean_links(box.select("a"))
+                        elif has_class(box, "onym"):
+                            items = clean_links(box.css("a"))
                             details.append({"type": "see_also", "items": items})
-                        elif "rel-begreber" in cls:
-                            items = clean_links(box.select("a"))
+                        elif has_class(box, "rel-begreber"):
+                            items = clean_links(box.css("a"))
                             details.append({"type": "related", "items": items})
-                        elif "grammatik" in cls:
-                            inline = box.select_one("span.inlineList")
-                            text = (inline or box).get_text(" ", strip=True)
+                        elif has_class(box, "grammatik"):
+                            inline = box.css_first("span.inlineList")
+                            text = (inline or box).text(separator=" ", strip=True)
                             details.append({"type": "grammar", "text": text})
                         else:
-                            st = box.select_one("span.stempel")
-                            if st and st.get_text(strip=True) == "SPROGBRUG":
-                                usage = box.select_one("span.tekstnormal")
+                            st = box.css_first("span.stempel")
+                            if st and st.text(strip=True) == "SPROGBRUG":
+                                usage = box.css_first("span.tekstnormal")
                                 if usage:
                                     details.append(
                                         {
                                             "type": "usage",
-                                            "text": usage.get_text(strip=True),
+                                            "text": usage.text(strip=True),
                                         }
                                     )
                                 continue
-                            if cite := box.select_one("div.citat-box"):
-                                txt = cite.select_one("span.citat").get_text(
-                                    " ", strip=True
+                            if cite := box.css_first("div.citat-box"):
+                                txt = cite.css_first("span.citat").text(
+                                    separator=" ", strip=True
                                 )
-                                src = cite.select_one("span.kilde")
+                                src = cite.css_first("span.kilde")
                                 details.append(
                                     {
                                         "type": "example",
                                         "text": txt,
                                         "source": (
-                                            src.get_text(strip=True) if src else None
+                                            src.text(strip=True) if src else None
                                         ),
                                     }
                                 )
-            node = node.next_sibling
+            node = node.next
         out.append({"expression": expr, "details": details})
     return out
 
 
 def parse_entry(path):
     fn = os.path.basename(path)
-    soup = BeautifulSoup(open(path, encoding="utf-8"), "html.parser")
-    art = soup.select_one("div.artikel")
+    # lexbor (C HTML5 parser + CSS engine) is roughly an order of magnitude
+    # faster than BeautifulSoup for pure extraction; pass raw bytes and let
+    # it handle the decoding. A single bulk read() per file is the best we
+    # can do: the binding only accepts str/bytes, so an mmap'd buffer would
+    # get copied anyway.
+    with open(path, "rb") as fp:
+        tree = LexborHTMLParser(fp.read())
+    art = tree.css_first("div.artikel")
     if not art:
         return None
 
-    raw_head = art.select_one("div.definitionBoxTop span.match").get_text(strip=True)
+    raw_head = art.css_first("div.definitionBoxTop span.match").text(strip=True)
     headword = DIGITS_TRAIL_RE.sub("", raw_head.strip()).strip()
 
-    pos_tag = art.select_one("div.definitionBoxTop span.tekstmedium")
-    pos = pos_tag.get_text(strip=True) if pos_tag else None
+    pos_tag = art.css_first("div.definitionBoxTop span.tekstmedium")
+    pos = pos_tag.text(strip=True) if pos_tag else None
+
+    # One CSS scan collects every label span; the per-label parsers then
+    # find their anchor with a dict lookup (first occurrence wins, as
+    # before)
+    stempels = {}
+    for s in tree.css("span.stempel"):
+        stempels.setdefault(s.text(strip=True), s)
 
-    raw_forms = [f for f in parse_wordforms(soup) if f != raw_head]
+    raw_forms = [f for f in parse_wordforms(stempels) if f != raw_head]
     forms = transform_wordforms(headword, raw_forms)
 
     return {
         "file": fn,
         "headword": headword,
         "pos": pos,
-        "udtale": parse_udtale(soup, fn),
+        "udtale": parse_udtale(tree, fn),
         "wordforms": forms,
-        "etymology": parse_etymology(soup),
-        "definitions": parse_definitions(soup, fn),
-        "fixed_expressions": parse_fixed_expressions(soup),
-        "orddannelser": parse_orddannelser(soup),
+        "etymology": parse_etymology(stempels),
+        "definitions": parse_definitions(tree, fn),
+        "fixed_expressions": parse_fixed_expressions(tree),
+        "orddannelser": parse_orddannelser(tree),
     }
 
 
@@ -295,14 +323,20 @@ def main():
     entries = []
     skipped_files = []
 
-    for fn in sorted(os.listdir(HTML_DIR)):
-        if not fn.endswith(".html"):
-            continue
-        entry = parse_entry(os.path.join(HTML_DIR, fn))
-        if entry:
-            entries.append(entry)
-        else:
-            skipped_files.append(fn)
+    paths = [
+        os.path.join(HTML_DIR, fn)
+        for fn in sorted(os.listdir(HTML_DIR))
+        if fn.endswith(".html")
+    ]
+
+    # Each file parses independently, so fan out across all cores;
+    # imap keeps results in path order for deterministic output
+    with multiprocessing.Pool() as pool:
+        for path, entry in zip(paths, pool.imap(parse_entry, paths, chunksize=64)):
+            if entry:
+                entries.append(entry)
+            else:
+                skipped_files.append(os.path.basename(path))
 
     print(f"Parsed {len(entries)} entries.")
     if skipped_files:
@@ -310,8 +344,12 @@ def main():
         for name in skipped_files:
             print("  -", name)
 
-    with open(OUTPUT, "w", encoding="utf-8") as f:
-        json.dump(entries, f, ensure_ascii=False, indent=2)
+    # JSON Lines: one orjson-serialized entry per line. Writing needs no
+    # giant in-memory document, and the dedupe step can stream it back
+    # line by line.
+    with open(OUTPUT, "wb") as f:
+        for entry in entries:
+            f.write(orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE))
 
 
 if __name__ == "__main__":
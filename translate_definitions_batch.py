@@ -1,17 +1,37 @@
 # Translate definitions in batch mode using a local LLM
-import json, os, time, random, re, unicodedata, logging
+import asyncio
+import json, os, random, re, unicodedata, logging
 from collections import OrderedDict
+from itertools import cycle
+import fastjsonschema
 import ollama
+import orjson
+
+import cache
 
 # Configuration
 TARGET_LANG = ""
 MODEL_NAME = "gemma3:12b-it-q8_0"
 INPUT = "ddo_entries_unique.json"
 OUTPUT = f"definition_translations_lemma_gloss_{TARGET_LANG}.json"
-MAX_RETRIES = 10
+# Append-only progress log; consolidated into OUTPUT by compact()
+PROGRESS_LOG = f"definition_translations_lemma_gloss_{TARGET_LANG}.jsonl"
+# Cross-headword cache of translated definition strings: identical
+# definitions (cross-references, POS stubs) recur under many headwords
+DEF_CACHE_FILE = f"definition_translation_cache_{TARGET_LANG}.json"
+# format="json" makes the decode grammar-constrained, so parse failures
+# are rare and a small retry budget suffices
+MAX_RETRIES = 2
 BASE_DELAY = 2
-SAVE_EVERY = 1
 MAX_DEFS_PER_BATCH = 30  #  Maximum number of definitions to send per batch
+# Number of in-flight requests; match the server's OLLAMA_NUM_PARALLEL so
+# every decoding slot stays busy
+OLLAMA_NUM_PARALLEL = 4
+# Comma-separated Ollama endpoints (e.g. one server per GPU); empty means
+# the default local server
+OLLAMA_HOSTS = [
+    h.strip() for h in os.environ.get("OLLAMA_HOSTS", "").split(",") if h.strip()
+]
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,20 +39,95 @@ logging.basicConfig(
 )
 
 
+_FENCE_RE = re.compile(r"^```(?:json)?|```$", re.IGNORECASE)
+
+# Canonical reply shape, compiled once at import. Replies that validate
+# skip the tolerant per-field walk entirely; the manual checks remain
+# only as the fallback for the alternate schemas the prompt allows.
+_VALIDATE = fastjsonschema.compile(
+    {
+        "type": "object",
+        "properties": {
+            "headword": {"type": "string"},
+            "definitions": {
+                "type": "object",
+                "patternProperties": {
+                    "^\\d+$": {"type": "object", "required": ["lemma", "gloss"]}
+                },
+                "additionalProperties": False,
+            },
+        },
+        "required": ["headword", "definitions"],
+    }
+)
+
+
 def try_parse_json(raw: str):
     """
     Strip code fences (```json) and attempt to parse the raw text as JSON.
     Returns the parsed object or None on failure.
     """
-    raw = unicodedata.normalize("NFC", raw)
-    txt = re.sub(r"^```(?:json)?|```$", "", raw.strip(), flags=re.IGNORECASE).strip()
+    if not raw.isascii():
+        raw = unicodedata.normalize("NFC", raw)
+    txt = _FENCE_RE.sub("", raw.strip()).strip()
     try:
         return json.loads(txt)
     except json.JSONDecodeError:
         return None
 
 
-def translate_definitions_for_entry(headword: str, defs: list[str]) -> dict:
+async def chat_json(client: ollama.AsyncClient, system: str, user: str) -> str:
+    """
+    Stream a JSON-constrained completion and stop as soon as the
+    top-level object closes, so no trailing tokens are decoded. Braces
+    inside JSON strings are ignored by the balance tracker.
+    """
+    parts = []
+    depth = 0
+    in_string = False
+    escape = False
+    started = False
+    closed = False
+
+    stream = await client.chat(
+        model=MODEL_NAME,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        format="json",
+        stream=True,
+    )
+    async for chunk in stream:
+        piece = chunk["message"]["content"]
+        parts.append(piece)
+        for ch in piece:
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{":
+                depth += 1
+                started = True
+            elif ch == "}":
+                depth -= 1
+                if started and depth == 0:
+                    closed = True
+                    break
+        if closed:
+            break
+
+    return "".join(parts)
+
+
+async def translate_definitions_for_entry(
+    client: ollama.AsyncClient, headword: str, defs: list[str]
+) -> dict:
     """
     Call the LLM to translate all definitions for a given headword.
     Each output entry should include 'lemma' and 'gloss'.
@@ -53,43 +148,59 @@ def translate_definitions_for_entry(headword: str, defs: list[str]) -> dict:
     )
 
     payload = {str(i): d for i, d in enumerate(defs)}
+    base_user_lines = [
+        f'Headword: "{headword}"',
+        "Input definitions JSON:",
+        orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode(),
+    ]
+
+    # reruns and re-translations hit the on-disk cache instead of the LLM
+    cache_key = cache.make_key(MODEL_NAME, system, "\n\n".join(base_user_lines))
+    cached = cache.get(cache_key)
+    if cached is not None:
+        logging.info(f"[{headword}] cache hit, skipping LLM call")
+        return cached
+
     last_feedback = None
 
     for attempt in range(1, MAX_RETRIES + 1):
         logging.info(f"[{headword}] translate attempt {attempt}/{MAX_RETRIES}")
 
-        user_lines = [
-            f'Headword: "{headword}"',
-            "Input definitions JSON:",
-            json.dumps(payload, ensure_ascii=False, indent=2),
-        ]
+        user_lines = list(base_user_lines)
         if last_feedback:
             user_lines.append(f"# NOTE: last attempt error → {last_feedback}")
         user_lines.append("Output format ONLY JSON in one of the accepted schemas")
         user = "\n\n".join(user_lines)
 
         try:
-            resp = ollama.chat(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": system},
-                    {"role": "user", "content": user},
-                ],
-            )
+            raw = await chat_json(client, system, user)
         except Exception as e:
             last_feedback = f"ollama error: {e}"
             logging.warning(f"[{headword}] {last_feedback}, retrying…")
-            time.sleep(BASE_DELAY * attempt + random.random())
+            await asyncio.sleep(BASE_DELAY * attempt + random.random())
             continue
 
-        raw = resp["message"]["content"]
         parsed = try_parse_json(raw)
         if not parsed:
             last_feedback = "invalid JSON"
             logging.error(f"[{headword}] {last_feedback}:\n  raw: {raw!r}")
-            time.sleep(BASE_DELAY * attempt + random.random())
+            await asyncio.sleep(BASE_DELAY * attempt + random.random())
             continue
 
+        # Fast path: a reply matching the canonical schema needs no
+        # further shape checks beyond headword and index agreement
+        try:
+            _VALIDATE(parsed)
+        except fastjsonschema.JsonSchemaException:
+            pass
+        else:
+            if parsed["headword"] == headword and set(parsed["definitions"]) == set(
+                payload
+            ):
+                result = {payload[i]: v for i, v in parsed["definitions"].items()}
+                cache.put(cache_key, result)
+                return result
+
         out_defs = None
         if parsed.get("headword") == headword and "definitions" in parsed:
             out_defs = parsed["definitions"]
@@ -103,7 +214,7 @@ def translate_definitions_for_entry(headword: str, defs: list[str]) -> dict:
         if out_defs is None:
             last_feedback = "no definitions in accepted schema"
             logging.error(f"[{headword}] {last_feedback}:\n  raw: {raw!r}")
-            time.sleep(BASE_DELAY * attempt + random.random())
+            await asyncio.sleep(BASE_DELAY * attempt + random.random())
             continue
 
         if isinstance(out_defs, list):
@@ -115,7 +226,7 @@ def translate_definitions_for_entry(headword: str, defs: list[str]) -> dict:
                     f"list length {len(out_defs)} != expected {len(payload)}"
                 )
                 logging.error(f"[{headword}] {last_feedback}")
-                time.sleep(BASE_DELAY * attempt + random.random())
+                await asyncio.sleep(BASE_DELAY * attempt + random.random())
                 continue
 
         if not isinstance(out_defs, dict) or set(out_defs.keys()) != set(
@@ -123,7 +234,7 @@ def translate_definitions_for_entry(headword: str, defs: list[str]) -> dict:
         ):
             last_feedback = f"keys mismatch, got {set(out_defs.keys())}"
             logging.error(f"[{headword}] {last_feedback}")
-            time.sleep(BASE_DELAY * attempt + random.random())
+            await asyncio.sleep(BASE_DELAY * attempt + random.random())
             continue
 
         result = {}
@@ -140,6 +251,7 @@ def translate_definitions_for_entry(headword: str, defs: list[str]) -> dict:
 
             result[payload[idx]] = entry
 
+        cache.put(cache_key, result)
         return result
 
     logging.error(
@@ -148,16 +260,264 @@ def translate_definitions_for_entry(headword: str, defs: list[str]) -> dict:
     raise RuntimeError(f"[{headword}] failed after {MAX_RETRIES}: {last_feedback}")
 
 
-def save_progress(done: dict):
-    with open(OUTPUT, "w", encoding="utf-8") as f:
-        json.dump(done, f, ensure_ascii=False, indent=2)
+def append_progress(log_fp, hw: str, result: dict):
+    """
+    Append one completed headword to the JSONL progress log. O(1) per
+    headword, unlike rewriting the whole done dict every save.
+    """
+    log_fp.write(orjson.dumps({hw: result}, option=orjson.OPT_APPEND_NEWLINE))
+    log_fp.flush()
 
 
-def main():
+def load_done() -> dict:
+    """
+    Rebuild done from the consolidated JSON plus any progress-log lines
+    left by an interrupted run (later lines win).
+    """
+    done = {}
+    if os.path.exists(OUTPUT):
+        done = json.load(open(OUTPUT, encoding="utf-8"))
+    if os.path.exists(PROGRESS_LOG):
+        with open(PROGRESS_LOG, "rb") as f:
+            for line in f:
+                if line.strip():
+                    done.update(orjson.loads(line))
+    return done
+
+
+def compact(done: dict):
+    """
+    Consolidate everything into the JSON file the exporter reads (tmp
+    file + atomic rename) and drop the progress log.
+    """
+    tmp = OUTPUT + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(orjson.dumps(done, option=orjson.OPT_INDENT_2))
+    os.replace(tmp, OUTPUT)
+    if os.path.exists(PROGRESS_LOG):
+        os.remove(PROGRESS_LOG)
+
+
+def pack_batch(items, max_defs=MAX_DEFS_PER_BATCH):
+    """
+    Group (headword, defs) pairs into packs whose combined definition
+    count fits max_defs, so several short entries share one prompt
+    instead of each paying the full request overhead. Sorting by
+    definition count first keeps each pack's members similarly sized;
+    oversized headwords pass through as single-item packs and are split
+    downstream as before.
+    """
+    small = []
+    for item in items:
+        if len(item[1]) > max_defs:
+            yield [item]
+        else:
+            small.append(item)
+    small.sort(key=lambda item: len(item[1]))
+
+    pack, count = [], 0
+    for item in small:
+        n = len(item[1])
+        if pack and count + n > max_defs:
+            yield pack
+            pack, count = [], 0
+        pack.append(item)
+        count += n
+    if pack:
+        yield pack
+
+
+async def translate_definitions_for_pack(client, pack) -> dict:
+    """
+    Translate several headwords' definitions in one request. The prompt
+    and reply are keyed by headword:
+      { "<headword>": { "definitions": { "0": {lemma,gloss}, … } }, … }
+    Returns {headword: {definition: {lemma, gloss}}}; raises after
+    MAX_RETRIES like the single-headword path.
+    """
+    system = (
+        f"You are a professional dictionary editor translating Danish definitions into {TARGET_LANG} for this Danish studying program.\n"
+        "Do NOT translate the headwords; keep them exactly as provided.\n"
+        "For each definition, output a JSON object with two fields:\n"
+        f"  lemma — the most appropriate {TARGET_LANG} equivalent of the Danish headword for this particular definition (one word or fixed phrase), preserving part of speech;\n"
+        f"    • if a natural, commonly‑used word or fixed phrase exists, prefer it over a literal description;\n"
+        f"  gloss — a brief explanatory translation of the definition in {TARGET_LANG}.\n"
+        "Return ONLY valid JSON in this schema:\n"
+        '  { "<headword>": { "definitions": { "0": {lemma,gloss}, … } }, … }\n'
+        "with exactly the same headwords and definition indices as the input."
+    )
+
+    payloads = {hw: {str(i): d for i, d in enumerate(defs)} for hw, defs in pack}
+    names = ", ".join(payloads)
+    base_user_lines = [
+        "Input definitions JSON (keyed by headword):",
+        orjson.dumps(
+            {hw: {"definitions": p} for hw, p in payloads.items()},
+            option=orjson.OPT_INDENT_2,
+        ).decode(),
+    ]
+
+    cache_key = cache.make_key(MODEL_NAME, system, "\n\n".join(base_user_lines))
+    cached = cache.get(cache_key)
+    if cached is not None:
+        logging.info(f"[pack: {names}] cache hit, skipping LLM call")
+        return cached
+
+    last_feedback = None
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        logging.info(f"[pack: {names}] translate attempt {attempt}/{MAX_RETRIES}")
+
+        user_lines = list(base_user_lines)
+        if last_feedback:
+            user_lines.append(f"# NOTE: last attempt error → {last_feedback}")
+        user_lines.append("Output format ONLY JSON in the accepted schema")
+        user = "\n\n".join(user_lines)
+
+        try:
+            raw = await chat_json(client, system, user)
+        except Exception as e:
+            last_feedback = f"ollama error: {e}"
+            logging.warning(f"[pack: {names}] {last_feedback}, retrying…")
+            await asyncio.sleep(BASE_DELAY * attempt + random.random())
+            continue
+
+        parsed = try_parse_json(raw)
+        if not parsed:
+            last_feedback = "invalid JSON"
+            logging.error(f"[pack: {names}] {last_feedback}:\n  raw: {raw!r}")
+            await asyncio.sleep(BASE_DELAY * attempt + random.random())
+            continue
+
+        result = {}
+        bad = None
+        for hw, payload in payloads.items():
+            cand = parsed.get(hw)
+            out_defs = None
+            if isinstance(cand, dict):
+                if isinstance(cand.get("definitions"), dict):
+                    out_defs = cand["definitions"]
+                elif all(k.isdigit() for k in cand.keys()):
+                    out_defs = cand
+            if not isinstance(out_defs, dict) or set(out_defs.keys()) != set(
+                payload.keys()
+            ):
+                bad = hw
+                break
+
+            hw_result = {}
+            for idx, val in out_defs.items():
+                if isinstance(val, dict) and "lemma" in val and "gloss" in val:
+                    entry = val
+                elif isinstance(val, str):
+                    entry = {"lemma": val, "gloss": val}
+                else:
+                    logging.error(
+                        f"[{hw}] invalid entry type for {idx}: {type(val).__name__}"
+                    )
+                    entry = {"lemma": "", "gloss": ""}
+                hw_result[payload[idx]] = entry
+            result[hw] = hw_result
+
+        if bad is not None:
+            last_feedback = f"missing or mismatched definitions for '{bad}'"
+            logging.error(f"[pack: {names}] {last_feedback}")
+            await asyncio.sleep(BASE_DELAY * attempt + random.random())
+            continue
+
+        cache.put(cache_key, result)
+        return result
+
+    raise RuntimeError(f"[pack: {names}] failed after {MAX_RETRIES}: {last_feedback}")
+
+
+async def translate_pack(client, pack):
+    """
+    Translate one pack, falling back to per-headword requests when the
+    combined prompt keeps failing, so one bad member can't sink the
+    whole pack. Returns {headword: result} with failures omitted.
+    """
+    if len(pack) == 1:
+        hw, defs = pack[0]
+        result = await translate_headword(client, hw, defs)
+        return {} if result is None else {hw: result}
+
+    try:
+        results = await translate_definitions_for_pack(client, pack)
+        logging.info(f"[pack] saved {len(results)} headwords in one call.")
+        return results
+    except Exception as e:
+        logging.error(str(e))
+        results = {}
+        for hw, defs in pack:
+            result = await translate_headword(client, hw, defs)
+            if result is not None:
+                results[hw] = result
+        return results
+
+
+async def translate_headword(client, hw: str, defs: list[str]):
+    """
+    Translate one headword, splitting oversized definition lists into
+    sequential sub-batches. Returns the merged mapping, or None if the
+    headword failed outright (so it is retried on the next run).
+    """
+    if len(defs) > MAX_DEFS_PER_BATCH:
+        logging.info(
+            f"[{hw}] {len(defs)} definitions exceed batch size, splitting into batches of {MAX_DEFS_PER_BATCH}"
+        )
+        merged = {}
+        for idx in range(0, len(defs), MAX_DEFS_PER_BATCH):
+            batch = defs[idx : idx + MAX_DEFS_PER_BATCH]
+            try:
+                part = await translate_definitions_for_entry(client, hw, batch)
+                merged.update(part)
+                logging.info(
+                    f"[{hw}] batch {idx//MAX_DEFS_PER_BATCH + 1} complete, {len(part)} entries"
+                )
+            except Exception as e:
+                logging.error(f"[{hw}] batch {idx//MAX_DEFS_PER_BATCH + 1} failed: {e}")
+
+                merged = {}
+                break
+        logging.info(f"[{hw}] merged total {len(merged)} definitions.")
+        return merged
+
+    try:
+        result = await translate_definitions_for_entry(client, hw, defs)
+        logging.info(f"[{hw}] saved {len(result)} defs with lemma/gloss.")
+        return result
+    except Exception as e:
+        logging.error(str(e))
+        return None
+
+
+async def main_async():
     entries = json.load(open(INPUT, encoding="utf-8"))
-    done = json.load(open(OUTPUT, encoding="utf-8")) if os.path.exists(OUTPUT) else {}
+    done = load_done()
 
-    completed = 0
+    # One client per configured host, handed out round-robin so a
+    # multi-GPU setup (one Ollama server per GPU) is loaded evenly; each
+    # host contributes its own OLLAMA_NUM_PARALLEL slots
+    if OLLAMA_HOSTS:
+        clients = [ollama.AsyncClient(host=h) for h in OLLAMA_HOSTS]
+    else:
+        clients = [ollama.AsyncClient()]
+    client_cycle = cycle(clients)
+    n_workers = OLLAMA_NUM_PARALLEL * len(clients)
+
+    global_def_cache = {}
+    if os.path.exists(DEF_CACHE_FILE):
+        global_def_cache = json.load(open(DEF_CACHE_FILE, encoding="utf-8"))
+    # seed from earlier results so the cache helps even when the sidecar
+    # file is missing
+    for translations in done.values():
+        for d, tr in translations.items():
+            global_def_cache.setdefault(d, tr)
+
+    todo = []
+    cached_parts = {}
+    reused = 0
     for entry in entries:
         hw = entry["headword"]
         if hw in done:
@@ -170,41 +530,76 @@ def main():
             done[hw] = {}
             continue
 
-        if len(defs) > MAX_DEFS_PER_BATCH:
-            logging.info(
-                f"[{hw}] {len(defs)} definitions exceed batch size, splitting into batches of {MAX_DEFS_PER_BATCH}"
-            )
-            merged = {}
-            for idx in range(0, len(defs), MAX_DEFS_PER_BATCH):
-                batch = defs[idx : idx + MAX_DEFS_PER_BATCH]
-                try:
-                    part = translate_definitions_for_entry(hw, batch)
-                    merged.update(part)
-                    logging.info(
-                        f"[{hw}] batch {idx//MAX_DEFS_PER_BATCH + 1} complete, {len(part)} entries"
-                    )
-                except Exception as e:
-                    logging.error(
-                        f"[{hw}] batch {idx//MAX_DEFS_PER_BATCH + 1} failed: {e}"
-                    )
+        # only send definitions the cache has never seen; the rest are
+        # filled in from earlier translations
+        known = {d: global_def_cache[d] for d in defs if d in global_def_cache}
+        new_defs = [d for d in defs if d not in global_def_cache]
+        reused += len(known)
+        if not new_defs:
+            done[hw] = known
+            continue
+        if known:
+            cached_parts[hw] = known
+        todo.append((hw, new_defs))
 
-                    merged = {}
-                    break
-            done[hw] = merged
-            logging.info(f"[{hw}] merged total {len(merged)} definitions.")
-        else:
-            try:
-                done[hw] = translate_definitions_for_entry(hw, defs)
-                logging.info(f"[{hw}] saved {len(done[hw])} defs with lemma/gloss.")
-            except Exception as e:
-                logging.error(str(e))
-                continue
+    if reused:
+        logging.info(f"Reused {reused} definition translations from the cache.")
+
+    # Bounded pipeline: the producer feeds packs into a small queue, one
+    # worker per decoding slot keeps the server's continuous batch full,
+    # and a single writer owns done/the caches and the progress log, so
+    # no request waits for another to be fully written out.
+    in_q = asyncio.Queue(maxsize=n_workers * 2)
+    out_q = asyncio.Queue()
+
+    async def producer():
+        for pack in pack_batch(todo):
+            await in_q.put(pack)
+        for _ in range(n_workers):
+            await in_q.put(None)
+
+    async def worker():
+        while True:
+            pack = await in_q.get()
+            if pack is None:
+                return
+            results = await translate_pack(next(client_cycle), pack)
+            await out_q.put(results)
 
-        completed += 1
-        if completed % SAVE_EVERY == 0:
-            save_progress(done)
+    async def writer():
+        log_fp = open(PROGRESS_LOG, "ab")
+        try:
+            while True:
+                results = await out_q.get()
+                if results is None:
+                    return
+                for hw, result in results.items():
+                    global_def_cache.update(result)
+                    if hw in cached_parts:
+                        result = {**cached_parts.pop(hw), **result}
+                    done[hw] = result
+                    append_progress(log_fp, hw, result)
+        finally:
+            log_fp.close()
+
+    writer_task = asyncio.create_task(writer())
+    workers = [asyncio.create_task(worker()) for _ in range(n_workers)]
+    try:
+        await producer()
+        await asyncio.gather(*workers)
+    finally:
+        await out_q.put(None)
+        await writer_task
+
+    compact(done)
+    with open(DEF_CACHE_FILE, "wb") as f:
+        f.write(orjson.dumps(global_def_cache, option=orjson.OPT_INDENT_2))
     logging.info("All done! ✓")
 
 
+def main():
+    asyncio.run(main_async())
+
+
 if __name__ == "__main__":
     main()
@@ -17,13 +17,17 @@ logging.basicConfig(
 )
 
 
+_FENCE_RE = re.compile(r"^```(?:json)?|```$", re.IGNORECASE)
+
+
 def try_parse_json(raw: str):
     """
     Strip JSON code fences and attempt to parse the content.
     Returns the parsed object or None if parsing fails.
     """
-    raw = unicodedata.normalize("NFC", raw)
-    txt = re.sub(r"^```(?:json)?|```$", "", raw.strip(), flags=re.IGNORECASE).strip()
+    if not raw.isascii():
+        raw = unicodedata.normalize("NFC", raw)
+    txt = _FENCE_RE.sub("", raw.strip()).strip()
     try:
         return json.loads(txt)
     except json.JSONDecodeError:
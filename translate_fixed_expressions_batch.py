@@ -1,17 +1,31 @@
 # Batch translation of fixed expressions using a local LLM
 
 import json, os, time, random, re, unicodedata, logging
+from itertools import cycle
 import ollama
+import orjson
+
+import cache
 
 # Configuration
 TARGET_LANG = ""
 MODEL_NAME = "gemma3:12b-it-q8_0"
 INPUT = "ddo_entries_unique.json"
 OUTPUT = f"expr_translations_{TARGET_LANG}.json"
-MAX_RETRIES = 10
+# Append-only progress log; consolidated into OUTPUT by compact()
+PROGRESS_LOG = f"expr_translations_{TARGET_LANG}.jsonl"
+# format="json" makes the decode grammar-constrained, so parse failures
+# are rare and a small retry budget suffices
+MAX_RETRIES = 2
 BASE_DELAY = 2
-SAVE_EVERY = 1
 MAX_EXPR_PER_BATCH = 20
+# Comma-separated Ollama endpoints (e.g. one server per GPU); empty means
+# the default local server
+OLLAMA_HOSTS = [
+    h.strip() for h in os.environ.get("OLLAMA_HOSTS", "").split(",") if h.strip()
+]
+_clients = [ollama.Client(host=h) for h in OLLAMA_HOSTS] or [ollama.Client()]
+_client_cycle = cycle(_clients)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,9 +33,13 @@ logging.basicConfig(
 )
 
 
+_FENCE_RE = re.compile(r"^```(?:json)?|```$", re.IGNORECASE)
+
+
 def try_parse_json(raw: str):
-    raw = unicodedata.normalize("NFC", raw)
-    txt = re.sub(r"^```(?:json)?|```$", "", raw.strip(), flags=re.IGNORECASE).strip()
+    if not raw.isascii():
+        raw = unicodedata.normalize("NFC", raw)
+    txt = _FENCE_RE.sub("", raw.strip()).strip()
     try:
         return json.loads(txt)
     except json.JSONDecodeError:
@@ -51,27 +69,41 @@ def translate_fixed_expressions_for_entry(headword: str, exprs: list[str]) -> di
     )
 
     payload = {str(i): expr for i, expr in enumerate(exprs)}
+    base_user = "\n\n".join(
+        [
+            f'Headword: "{headword}"',
+            "Input fixed_expressions JSON:",
+            orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode(),
+        ]
+    )
+
+    # reruns and re-translations hit the on-disk cache instead of the LLM
+    cache_key = cache.make_key(MODEL_NAME, system, base_user)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        logging.info(f"[{headword}] cache hit, skipping LLM call")
+        return cached
+
     last_feedback = None
 
     for attempt in range(1, MAX_RETRIES + 1):
         logging.info(f"[{headword}] expr translate attempt {attempt}/{MAX_RETRIES}")
         user = "\n\n".join(
             [
-                f'Headword: "{headword}"',
-                "Input fixed_expressions JSON:",
-                json.dumps(payload, ensure_ascii=False, indent=2),
+                base_user,
                 *([f"# NOTE: last error → {last_feedback}"] if last_feedback else []),
                 "Output format ONLY JSON as per schema.",
             ]
         )
 
         try:
-            resp = ollama.chat(
+            resp = next(_client_cycle).chat(
                 model=MODEL_NAME,
                 messages=[
                     {"role": "system", "content": system},
                     {"role": "user", "content": user},
                 ],
+                format="json",
             )
         except Exception as e:
             last_feedback = f"ollama error: {e}"
@@ -112,6 +144,7 @@ def translate_fixed_expressions_for_entry(headword: str, exprs: list[str]) -> di
                 logging.error(f"[{headword}] {last_feedback}")
                 result[payload[idx]] = {"lemma": "", "gloss": ""}
 
+        cache.put(cache_key, result)
         return result
 
     raise RuntimeError(
@@ -119,45 +152,83 @@ def translate_fixed_expressions_for_entry(headword: str, exprs: list[str]) -> di
     )
 
 
-def save_progress(done: dict):
-    with open(OUTPUT, "w", encoding="utf-8") as f:
-        json.dump(done, f, ensure_ascii=False, indent=2)
+def append_progress(log_fp, hw: str, record: dict):
+    """
+    Append one completed headword to the JSONL progress log. O(1) per
+    headword, unlike rewriting the whole done dict every save.
+    """
+    log_fp.write(orjson.dumps({hw: record}, option=orjson.OPT_APPEND_NEWLINE))
+    log_fp.flush()
+
+
+def load_done() -> dict:
+    """
+    Rebuild done from the consolidated JSON plus any progress-log lines
+    left by an interrupted run (later lines win).
+    """
+    done = {}
+    if os.path.exists(OUTPUT):
+        done = json.load(open(OUTPUT, encoding="utf-8"))
+    if os.path.exists(PROGRESS_LOG):
+        with open(PROGRESS_LOG, "rb") as f:
+            for line in f:
+                if line.strip():
+                    done.update(orjson.loads(line))
+    return done
+
+
+def compact(done: dict):
+    """
+    Consolidate everything into the JSON file the exporter reads (tmp
+    file + atomic rename) and drop the progress log.
+    """
+    tmp = OUTPUT + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(orjson.dumps(done, option=orjson.OPT_INDENT_2))
+    os.replace(tmp, OUTPUT)
+    if os.path.exists(PROGRESS_LOG):
+        os.remove(PROGRESS_LOG)
 
 
 def main():
     entries = json.load(open(INPUT, encoding="utf-8"))
-    done = json.load(open(OUTPUT, encoding="utf-8")) if os.path.exists(OUTPUT) else {}
+    done = load_done()
 
-    for entry in entries:
-        hw = entry["headword"]
+    log_fp = open(PROGRESS_LOG, "ab")
+    try:
+        for entry in entries:
+            hw = entry["headword"]
 
-        if hw in done and "fixed_expressions" in done[hw]:
-            continue
+            if hw in done and "fixed_expressions" in done[hw]:
+                continue
+
+            exprs = [e["expression"] for e in entry.get("fixed_expressions", [])]
+            if not exprs:
+                done.setdefault(hw, {})["fixed_expressions"] = {}
+            else:
 
-        exprs = [e["expression"] for e in entry.get("fixed_expressions", [])]
-        if not exprs:
-            done.setdefault(hw, {})["fixed_expressions"] = {}
-        else:
-
-            merged = {}
-            for i in range(0, len(exprs), MAX_EXPR_PER_BATCH):
-                batch = exprs[i : i + MAX_EXPR_PER_BATCH]
-                try:
-                    part = translate_fixed_expressions_for_entry(hw, batch)
-                    merged.update(part)
-                    logging.info(
-                        f"[{hw}] batch {i//MAX_EXPR_PER_BATCH+1} done: {len(part)} exprs"
-                    )
-                except Exception as e:
-                    logging.error(f"[{hw}] batch {i//MAX_EXPR_PER_BATCH+1} failed: {e}")
-                    merged = {}
-                    break
-            done.setdefault(hw, {})["fixed_expressions"] = merged
-
-        if entry["headword"] in done and SAVE_EVERY and len(done) % SAVE_EVERY == 0:
-            save_progress(done)
-
-    save_progress(done)
+                merged = {}
+                for i in range(0, len(exprs), MAX_EXPR_PER_BATCH):
+                    batch = exprs[i : i + MAX_EXPR_PER_BATCH]
+                    try:
+                        part = translate_fixed_expressions_for_entry(hw, batch)
+                        merged.update(part)
+                        logging.info(
+                            f"[{hw}] batch {i//MAX_EXPR_PER_BATCH+1} done: {len(part)} exprs"
+                        )
+                    except Exception as e:
+                        logging.error(
+                            f"[{hw}] batch {i//MAX_EXPR_PER_BATCH+1} failed: {e}"
+                        )
+                        merged = {}
+                        break
+                done.setdefault(hw, {})["fixed_expressions"] = merged
+
+            append_progress(log_fp, hw, done[hw])
+    finally:
+        log_fp.close()
+
+    compact(done)
     logging.info("All fixed_expressions translated! ✓")
 
 
@@ -1,14 +1,18 @@
 # Use a local LLM to translate part-of-speech labels
 
 import json
+import os
 import re
 import time
 import random
 import unicodedata
 import logging
 from collections import defaultdict, Counter
+from itertools import cycle
 import ollama
 
+import cache
+
 # Configuration
 TARGET_LANG = ""
 MODEL_NAME = "gemma3:12b-it-q8_0"
@@ -16,6 +20,13 @@ MAX_RETRIES = 5
 BASE_DELAY = 2
 INPUT_JSON = "ddo_entries_unique.json"
 OUTPUT_JSON = f"pos_translations_{TARGET_LANG}.json"
+# Comma-separated Ollama endpoints (e.g. one server per GPU); empty means
+# the default local server
+OLLAMA_HOSTS = [
+    h.strip() for h in os.environ.get("OLLAMA_HOSTS", "").split(",") if h.strip()
+]
+_clients = [ollama.Client(host=h) for h in OLLAMA_HOSTS] or [ollama.Client()]
+_client_cycle = cycle(_clients)
 
 # Logging configuration
 logging.basicConfig(
@@ -25,11 +36,13 @@ logging.basicConfig(
 )
 
 
+_FENCE_RE = re.compile(r"^```(?:json)?|```$", re.IGNORECASE)
+
+
 def try_parse_json(raw: str) -> dict | None:
-    raw = unicodedata.normalize("NFC", raw)
-    text = raw.strip()
-    text = re.sub(r"^```(?:json)?", "", text, flags=re.IGNORECASE)
-    text = re.sub(r"```$", "", text, flags=re.IGNORECASE).strip()
+    if not raw.isascii():
+        raw = unicodedata.normalize("NFC", raw)
+    text = _FENCE_RE.sub("", raw.strip()).strip()
     try:
         return json.loads(text)
     except json.JSONDecodeError:
@@ -41,7 +54,19 @@ def translate_all(tags: list[str]) -> dict[str, str]:
     """
     Translate all POS tags in one request, returning a mapping of {original_tag: translated_tag}.
     Prompts are adjusted dynamically based on the target language.
+    The validated mapping is cached by (model, target language, tag set),
+    so reruns over the same corpus never hit the LLM.
     """
+    cache_key = cache.make_key(
+        MODEL_NAME,
+        f"pos:{TARGET_LANG}",
+        json.dumps(sorted(tags), ensure_ascii=False),
+    )
+    cached = cache.get(cache_key)
+    if cached is not None:
+        logging.info("POS translations served from cache.")
+        return cached
+
     payload = {tag: "" for tag in tags}
 
     system_prompt = (
@@ -69,12 +94,13 @@ def translate_all(tags: list[str]) -> dict[str, str]:
         logging.info(
             f"Translation attempt {attempt}/{MAX_RETRIES}, delay {delay:.1f}s..."
         )
-        resp = ollama.chat(
+        resp = next(_client_cycle).chat(
             model=MODEL_NAME,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
+            format="json",
         )
         raw = resp["message"]["content"]
         parsed = try_parse_json(raw)
@@ -96,6 +122,7 @@ def translate_all(tags: list[str]) -> dict[str, str]:
                     logging.warning(f"Suspicious duplicate translations: {suspicious}")
                 else:
                     logging.info("Translation successful!")
+                    cache.put(cache_key, parsed)
                     return parsed
 
         time.sleep(delay)
@@ -1,10 +1,14 @@
 # Check and download the largest HTML version for each word
 
 import os
+import re
+import threading
 import time
 import requests
 from bs4 import BeautifulSoup
-from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import unquote_plus
 
 HTML_DIR = "ddo_html"  # Your directory for HTML files
 HEADERS = {
@@ -16,22 +20,84 @@ HEADERS = {
 }
 MAX_RETRIES = 5
 RETRY_DELAY = 60
+MAX_WORKERS = 8
+
+# One keep-alive session amortizes TCP/TLS handshakes across probes,
+# downloads and words
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+# ordnet.dk HTML compresses roughly 5:1
+SESSION.headers["Accept-Encoding"] = "gzip"
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+class TokenBucket:
+    """
+    AIMD rate limiter: throughput rises slowly while the server keeps
+    answering and halves as soon as it pushes back with a 503, instead
+    of pessimistically sleeping a fixed interval between words.
+    """
+
+    def __init__(self, rate=1.0, burst=5, recovery_every=10):
+        self.rate = rate  # tokens (downloads) per second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.recovery_every = recovery_every
+        self._successes = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.last) * self.rate
+                )
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def backoff(self):
+        """Multiplicative decrease: the server answered 503."""
+        with self._lock:
+            self.rate = max(self.rate / 2, 0.05)
+            self._successes = 0
+        print(f"    [rate] 503 seen, slowing to {self.rate:.2f} req/s")
+
+    def success(self):
+        """Additive increase: +10% after every recovery_every successes."""
+        with self._lock:
+            self._successes += 1
+            if self._successes >= self.recovery_every:
+                self._successes = 0
+                self.rate *= 1.1
+
+
+RATE_LIMITER = TokenBucket(rate=1.0, burst=5)
+
+
+# Only the select parameter is ever inspected, so a single regex beats a
+# full urlparse + parse_qs round trip per link
+_SELECT_RE = re.compile(r"(?:^|[?&])select=([^&]+)")
 
 
 def find_alternate_urls(soup, headword):
     """
     Extract all links from searchResultBox whose select parameter begins with <headword>,N
     """
-    box = soup.find("div", class_="searchResultBox")
-    if not box:
+    box = soup.select_one("div.searchResultBox")
+    if box is None:
         return []
     urls = []
-    for a in box.find_all("a", href=True):
+    for a in box.select("a[href]"):
         href = a["href"]
-        parsed = urlparse(href)
-        qs = parse_qs(parsed.query)
-        sel = qs.get("select", [])
-        if sel and sel[0].split(",")[0] == headword:
+        m = _SELECT_RE.search(href)
+        if m and unquote_plus(m.group(1)).split(",")[0] == headword:
             # Make URL absolute if it's relative
             if href.startswith("/"):
                 href = f"https://ordnet.dk{href}"
@@ -47,11 +113,14 @@ def download_with_retries(url):
     """
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            r = requests.get(url, headers=HEADERS, timeout=10)
+            r = SESSION.get(url, timeout=10)
             r.raise_for_status()
+            RATE_LIMITER.success()
             return r.content, None
         except requests.exceptions.HTTPError as e:
             status = getattr(e.response, "status_code", None)
+            if status == 503:
+                RATE_LIMITER.backoff()
             if status == 503 and attempt < MAX_RETRIES:
                 print(
                     f"    [!] 503 on {url}, waiting {RETRY_DELAY}s before retry ({attempt}/{MAX_RETRIES})..."
@@ -64,41 +133,62 @@ def download_with_retries(url):
     return None, "Max retries reached"
 
 
+def _head_size(url):
+    """HEAD-probe one url, returning (url, Content-Length or 0 on failure)."""
+    try:
+        r = SESSION.head(url, timeout=5)
+        r.raise_for_status()
+        return url, int(r.headers.get("Content-Length", 0))
+    except Exception:
+        return url, 0
+
+
 def download_best(urls):
     """
-    Always download all urls, compare actual downloaded byte sizes,
-    and return (best_url, best_content, best_size).
+    Pick the largest candidate version and return
+    (best_url, best_content, best_size).
+
+    When every HEAD probe reports a Content-Length, that already decides
+    the winner and only that one url is downloaded. Downloading all
+    candidates to compare actual sizes is kept as the fallback for when
+    any probe fails or reports 0.
     """
     best_url = None
     best_content = None
     best_size = -1
+    workers = min(len(urls), MAX_WORKERS)
 
-    # 1) Probe sizes via HEAD requests and print results
+    # 1) Probe sizes via parallel HEAD requests and print results
     print("    Candidate version size probing:")
-    head_sizes = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        head_sizes = dict(pool.map(_head_size, urls))
     for url in urls:
-        try:
-            r = requests.head(url, headers=HEADERS, timeout=5)
-            r.raise_for_status()
-            size = int(r.headers.get("Content-Length", 0))
-        except Exception:
-            size = 0
-        head_sizes[url] = size
-        print(f"      - {url} → {size} bytes")
-
-    # 2) Download each URL and compare actual size
+        print(f"      - {url} → {head_sizes[url]} bytes")
+
+    # 2) All probes answered → the sizes are trustworthy, one GET suffices
+    if all(head_sizes.values()):
+        best_url = max(head_sizes, key=head_sizes.get)
+        print(f"    HEAD sizes conclusive, downloading only {best_url}")
+        content, err = download_with_retries(best_url)
+        if content is not None:
+            return best_url, content, len(content)
+        print(f"    [!] Download failed: {best_url} → {err}")
+        return None, None, -1
+
+    # 3) Fallback: download the URLs in parallel and compare actual sizes
     print("    Starting download of all candidate versions and comparing actual sizes:")
-    for url in urls:
-        content, err = download_with_retries(url)
-        if content is None:
-            print(f"    [!] Download failed: {url} → {err}")
-            continue
-        size = len(content)
-        print(f"    → Download complete {url} ({size} bytes)")
-        if size > best_size:
-            best_size = size
-            best_url = url
-            best_content = content
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        downloads = zip(urls, pool.map(download_with_retries, urls))
+        for url, (content, err) in downloads:
+            if content is None:
+                print(f"    [!] Download failed: {url} → {err}")
+                continue
+            size = len(content)
+            print(f"    → Download complete {url} ({size} bytes)")
+            if size > best_size:
+                best_size = size
+                best_url = url
+                best_content = content
 
     return best_url, best_content, best_size
 
@@ -111,8 +201,14 @@ def main():
         path = os.path.join(HTML_DIR, fn)
 
         # Read existing HTML
-        with open(path, encoding="utf-8") as f:
-            soup = BeautifulSoup(f, "html.parser")
+        with open(path, "rb") as f:
+            blob = f.read()
+
+        # Cheap bytes scan first: most files have no search-result box at
+        # all, so they never reach the parser
+        if b"searchResultBox" not in blob:
+            continue
+        soup = BeautifulSoup(blob, "lxml")
 
         # Find all candidate URLs
         alt_urls = find_alternate_urls(soup, headword)
@@ -120,6 +216,7 @@ def main():
             continue  # No extra versions
 
         print(f"\n[{fn}] Found {len(alt_urls)} versions:")
+        RATE_LIMITER.acquire()
         best_url, best_content, best_size = download_best(alt_urls)
 
         if not best_content:
@@ -135,8 +232,6 @@ def main():
             f"  ✓ Replaced {fn} with {best_url} ({best_size} bytes), backup saved as {os.path.basename(bak_path)}"
         )
 
-        time.sleep(10)
-
 
 if __name__ == "__main__":
     main()